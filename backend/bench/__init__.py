@@ -0,0 +1,6 @@
+"""
+Offline benchmark harness: fake LLM backend, local fixture site and load driver.
+
+Run from the backend folder:
+    uv run python -m bench.run --concurrency 1,4,16 --requests 50
+"""
@@ -0,0 +1,95 @@
+"""
+Stand-in LLM used by benchmarks, enabled with ENABLE_FAKE_LLM=1 and provider "Fake".
+
+Its behaviour is configured through the model name, e.g.
+"latency=0.5,tps=80,tokens=400,error_rate=0.02":
+- latency: seconds before the first token
+- tps: generated tokens per second
+- tokens: number of generated tokens
+- error_rate: probability of a simulated rate limit error
+"""
+
+from typing import AsyncIterator, Dict
+
+import asyncio
+import random
+import time
+from loguru import logger
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, BaseMessageChunk
+
+from llm import AIModel
+from rate_limiter import estimate_tokens
+
+DEFAULTS = {"latency": 0.5, "tps": 80.0, "tokens": 400, "error_rate": 0.0}
+
+ANSWER_LINES = [
+    "- **1.Executive Summary**: The agreement carries moderate risk.",
+    "- **2.Critical Red Flags**:",
+    '  - **Automatic renewal** - "renews automatically unless cancelled" (Section 4).',
+    '  - **Unilateral changes** - "we may change these terms at any time" (Section 9).',
+    "- **3.Minor Concerns**:",
+    '  - **Governing law** - "disputes are resolved in our home jurisdiction" (Section 12).',
+]
+
+
+class FakeRateLimitError(Exception):
+    pass
+
+
+def parse_spec(spec: str) -> Dict[str, float]:
+    settings = dict(DEFAULTS)
+    for part in spec.split(","):
+        if "=" in part:
+            key, value = part.split("=", 1)
+            if key.strip() in settings:
+                settings[key.strip()] = float(value)
+    return settings
+
+
+class FakeModel(AIModel):
+    """LLM stand-in with configurable latency, token rate and error rate"""
+
+    def __init__(self, spec: str) -> None:
+        settings = parse_spec(spec)
+        self.latency = settings["latency"]
+        self.tps = settings["tps"]
+        self.tokens = int(settings["tokens"])
+        self.error_rate = settings["error_rate"]
+        logger.info(f"Initializing FakeModel: {settings}")
+
+    def _tokens(self) -> list:
+        words = " ".join(ANSWER_LINES).split(" ")
+        return [(words[i % len(words)] + " ") for i in range(self.tokens)]
+
+    def _check_error(self) -> None:
+        if random.random() < self.error_rate:
+            raise FakeRateLimitError("429 Resource has been exhausted (fake)")
+
+    def _usage(self, prompt) -> dict:
+        input_tokens = estimate_tokens(
+            prompt.to_string() if hasattr(prompt, "to_string") else str(prompt)
+        )
+        return {
+            "input_tokens": input_tokens,
+            "output_tokens": self.tokens,
+            "total_tokens": input_tokens + self.tokens,
+        }
+
+    def invoke(self, prompt) -> BaseMessage:
+        self._check_error()
+        time.sleep(self.latency + self.tokens / self.tps)
+        return AIMessage(content="".join(self._tokens()), usage_metadata=self._usage(prompt))
+
+    async def ainvoke(self, prompt) -> BaseMessage:
+        self._check_error()
+        await asyncio.sleep(self.latency + self.tokens / self.tps)
+        return AIMessage(content="".join(self._tokens()), usage_metadata=self._usage(prompt))
+
+    async def astream(self, prompt) -> AsyncIterator[BaseMessageChunk]:
+        self._check_error()
+        await asyncio.sleep(self.latency)
+        tokens = self._tokens()
+        for i, token in enumerate(tokens):
+            await asyncio.sleep(1 / self.tps)
+            usage = self._usage(prompt) if i == len(tokens) - 1 else None
+            yield AIMessageChunk(content=token, usage_metadata=usage)
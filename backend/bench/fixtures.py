@@ -0,0 +1,193 @@
+"""
+Local fixture site for benchmarks: static agreement pages, a JavaScript-rendered
+page and PDFs of different sizes, generated on the fly without network access.
+
+Routes:
+- /static/<clauses>.html - static HTML agreement
+- /spa/<clauses>.html - page whose text is rendered by JavaScript
+- /pdf/<pages>.pdf - PDF agreement
+The optional query parameter `n` is written into the document, use unique values
+to get unique documents which bypass the fetch and analysis caches.
+"""
+
+from typing import List
+
+import hashlib
+import http.server
+import random
+import re
+import threading
+from functools import lru_cache
+from urllib.parse import parse_qs, urlparse
+
+SENTENCES = [
+    "The Customer shall pay all fees within thirty (30) days of the invoice date.",
+    "This Agreement renews automatically for successive one-year terms unless cancelled.",
+    "The Provider may modify these terms at any time without prior notice.",
+    "The Customer shall indemnify and hold harmless the Provider against all claims.",
+    "Either party may terminate this Agreement for material breach with notice.",
+    "All disputes shall be resolved by binding arbitration in the Provider's jurisdiction.",
+    "The Provider's total liability shall not exceed the fees paid in the last month.",
+    "The Customer grants the Provider a perpetual license to use submitted content.",
+    "Late payments accrue interest at the maximum rate permitted by law.",
+    "The Customer may not assign this Agreement without the Provider's written consent.",
+]
+TITLES = ["Fees", "Term and Renewal", "Changes", "Indemnification", "Termination", "Disputes"]
+
+
+@lru_cache(maxsize=64)
+def _clauses(count: int) -> List[str]:
+    rng = random.Random(count)
+    return [
+        f"{i}. {rng.choice(TITLES)}. " + " ".join(rng.choice(SENTENCES) for _ in range(5))
+        for i in range(1, count + 1)
+    ]
+
+
+def agreement_clauses(count: int, reference: str = "") -> List[str]:
+    """
+    Deterministic agreement text with `count` numbered clauses.
+    Different references give different documents, so content-addressed caches don't hit.
+    """
+    header = [f"Agreement reference: {reference}"] if reference else []
+    return header + _clauses(count)
+
+
+def make_html(clauses: int, reference: str = "") -> str:
+    paragraphs = "\n".join(f"<p>{clause}</p>" for clause in agreement_clauses(clauses, reference))
+    return (
+        "<!DOCTYPE html><html><head><title>Terms of Service</title></head><body>"
+        "<nav><a href='/'>Home</a> <a href='/about'>About</a></nav>"
+        f"<main><h1>Terms of Service</h1>\n{paragraphs}\n</main>"
+        "<footer>Copyright Example Inc.</footer></body></html>"
+    )
+
+
+def make_spa(clauses: int, reference: str = "") -> str:
+    text = "\\n".join(agreement_clauses(clauses, reference)).replace('"', '\\"')
+    return (
+        "<!DOCTYPE html><html><head><title>Terms</title></head><body>"
+        '<div id="root"></div>'
+        "<noscript>You need to enable JavaScript to run this app.</noscript>"
+        "<script>"
+        f'const text = "{text}";'
+        "const root = document.getElementById('root');"
+        "for (const line of text.split('\\n')) {"
+        "const p = document.createElement('p'); p.textContent = line; root.appendChild(p); }"
+        "</script></body></html>"
+    )
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(pages: int, reference: str = "") -> bytes:
+    """Minimal text-only PDF with `pages` pages of agreement clauses."""
+    clauses = agreement_clauses(pages * 3, reference)
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in when page object numbers are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_refs = []
+    for page in range(pages):
+        lines = []
+        for clause in clauses[page * 3 : page * 3 + 3]:
+            words = clause.split()
+            # wrap to ~90 characters per line
+            line = ""
+            for word in words:
+                if len(line) + len(word) > 90:
+                    lines.append(line)
+                    line = ""
+                line += word + " "
+            lines.append(line)
+        content = (
+            "BT /F1 10 Tf 50 750 Td 14 TL "
+            + " ".join(f"({_pdf_escape(line)}) Tj T*" for line in lines)
+            + " ET"
+        )
+        content_bytes = content.encode("latin-1")
+        objects.append(
+            b"<< /Length %d >>\nstream\n" % len(content_bytes) + content_bytes + b"\nendstream"
+        )
+        content_ref = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_ref
+        )
+        page_refs.append(len(objects))
+    kids = " ".join(f"{ref} 0 R" for ref in page_refs).encode()
+    objects[1] = b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % pages
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        output += b"%010d 00000 n \n" % offset
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1,
+        xref,
+    )
+    return bytes(output)
+
+
+class FixtureHandler(http.server.BaseHTTPRequestHandler):
+    routes = [
+        (re.compile(r"^/static/(\d+)\.html$"), "text/html; charset=utf-8", make_html),
+        (re.compile(r"^/spa/(\d+)\.html$"), "text/html; charset=utf-8", make_spa),
+        (re.compile(r"^/pdf/(\d+)\.pdf$"), "application/pdf", make_pdf),
+    ]
+
+    def do_GET(self) -> None:
+        url = urlparse(self.path)
+        reference = parse_qs(url.query).get("n", [""])[0]
+        for pattern, content_type, make in self.routes:
+            match = pattern.match(url.path)
+            if match:
+                body = make(int(match.group(1)), reference)
+                if isinstance(body, str):
+                    body = body.encode("utf-8")
+                etag = '"' + hashlib.md5(body).hexdigest() + '"'
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(body)
+                return
+        self.send_error(404)
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+class FixtureServer:
+    """Fixture site running in a background thread"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.httpd = http.server.ThreadingHTTPServer((host, port), FixtureHandler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self) -> "FixtureServer":
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,273 @@
+"""
+Load driver for the benchmark suite.
+
+Starts the fixture site and the API server (with the fake LLM) locally, sends analysis
+requests at several concurrency levels and reports latency percentiles, throughput,
+errors, peak RSS of the server process tree and the peak number of Chromium processes.
+Everything runs offline. Process statistics are read from /proc, so they are Linux only.
+
+Example:
+    uv run python -m bench.run --concurrency 1,4,16 --requests 50 --scenario static,pdf
+"""
+
+from typing import Dict, List, Optional
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import uuid
+import httpx
+
+from bench.fixtures import FixtureServer, agreement_clauses
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = ("text", "static", "spa", "pdf")
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _process_tree(root_pid: int) -> List[int]:
+    """Pids of the process and all its descendants."""
+    children: Dict[int, List[int]] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                parent = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(parent, []).append(int(entry))
+    pids, stack = [], [root_pid]
+    while stack:
+        pid = stack.pop()
+        pids.append(pid)
+        stack.extend(children.get(pid, []))
+    return pids
+
+
+def _rss_bytes(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def _is_chromium(pid: int) -> bool:
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            cmdline = f.read().lower()
+    except OSError:
+        return False
+    return b"chrom" in cmdline or b"headless_shell" in cmdline
+
+
+class ProcessSampler:
+    """Periodically samples RSS and Chromium process count of the server process tree"""
+
+    def __init__(self, pid: int, interval: float = 0.2):
+        self.pid = pid
+        self.interval = interval
+        self.peak_rss = 0
+        self.peak_chromium = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            pids = _process_tree(self.pid)
+            self.peak_rss = max(self.peak_rss, sum(_rss_bytes(pid) for pid in pids))
+            self.peak_chromium = max(self.peak_chromium, sum(_is_chromium(pid) for pid in pids))
+            self._stop.wait(self.interval)
+
+    def reset(self) -> None:
+        self.peak_rss = 0
+        self.peak_chromium = 0
+
+    def __enter__(self) -> "ProcessSampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+def start_server(port: int, log_path: Optional[str]) -> subprocess.Popen:
+    # fixture documents share all clauses but one, the clause index would answer them
+    server_env = {
+        **os.environ,
+        "ENABLE_FAKE_LLM": "1",
+        "CACHE_DB": "",
+        "CLAUSE_INDEX": os.environ.get("CLAUSE_INDEX", "0"),
+    }
+    log = open(log_path, "w") if log_path else subprocess.DEVNULL
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--port", str(port)],
+        cwd=BACKEND_DIR,
+        env=server_env,
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/", timeout=1)
+            return process
+        except httpx.HTTPError:
+            if process.poll() is not None:
+                raise RuntimeError("Server exited during start-up")
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("Server did not start in time")
+
+
+def make_payload(scenario: str, args, base_url: str, unique: bool) -> dict:
+    nonce = uuid.uuid4().hex if unique else "fixed"
+    payload = {
+        "api_key": "benchmark",
+        "llm_model_provider": "Fake",
+        "llm_model": args.model,
+        "free_tier": False,
+    }
+    if scenario == "text":
+        payload["text"] = "\n".join(agreement_clauses(args.clauses, nonce))
+    elif scenario == "static":
+        payload["url"] = f"{base_url}/static/{args.clauses}.html?n={nonce}"
+    elif scenario == "spa":
+        payload["url"] = f"{base_url}/spa/{args.clauses}.html?n={nonce}"
+    elif scenario == "pdf":
+        payload["url"] = f"{base_url}/pdf/{args.pages}.pdf?n={nonce}"
+    return payload
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return float("nan")
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[int(q) - 1]
+
+
+def _seconds(value: float) -> str:
+    return "-" if value != value else f"{value:.3f}s"
+
+
+async def run_level(
+    api_url: str, payloads: List[dict], concurrency: int, endpoint: str
+) -> Dict[str, float]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+
+    async def send(client: httpx.AsyncClient, payload: dict) -> None:
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                response = await client.post(f"{api_url}{endpoint}", json=payload)
+                if response.status_code != 200:
+                    errors += 1
+                    return
+            except httpx.HTTPError:
+                errors += 1
+                return
+            latencies.append(time.perf_counter() - started)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=300, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(send(client, payload) for payload in payloads))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "requests": len(payloads),
+        "errors": errors,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Offline benchmark of the /analyze pipeline")
+    parser.add_argument("--concurrency", default="1,4,16", help="comma separated levels")
+    parser.add_argument("--requests", type=int, default=50, help="requests per level and scenario")
+    parser.add_argument("--scenario", default="text,static,pdf", help=f"any of {SCENARIOS}")
+    parser.add_argument("--endpoint", default="/analyze")
+    parser.add_argument("--model", default="latency=0.5,tps=200,tokens=300,error_rate=0")
+    parser.add_argument("--clauses", type=int, default=40, help="clauses per HTML/text agreement")
+    parser.add_argument("--pages", type=int, default=20, help="pages per PDF agreement")
+    parser.add_argument(
+        "--repeat", action="store_true", help="reuse the same documents to measure caches"
+    )
+    parser.add_argument("--server-url", help="benchmark an already running server instead")
+    parser.add_argument("--server-log", help="write server output to this file")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args(argv)
+
+    levels = [int(level) for level in args.concurrency.split(",")]
+    scenarios = [scenario for scenario in args.scenario.split(",") if scenario in SCENARIOS]
+    results = []
+
+    with FixtureServer() as fixtures:
+        process = None
+        api_url = args.server_url
+        if api_url is None:
+            port = _free_port()
+            process = start_server(port, args.server_log)
+            api_url = f"http://127.0.0.1:{port}"
+        sampler_pid = process.pid if process else os.getpid()
+        try:
+            with ProcessSampler(sampler_pid) as sampler:
+                for scenario in scenarios:
+                    for level in levels:
+                        payloads = [
+                            make_payload(scenario, args, fixtures.base_url, not args.repeat)
+                            for _ in range(args.requests)
+                        ]
+                        sampler.reset()
+                        result = asyncio.run(run_level(api_url, payloads, level, args.endpoint))
+                        result.update(
+                            scenario=scenario,
+                            concurrency=level,
+                            peak_rss_mb=sampler.peak_rss / 1024 / 1024,
+                            peak_chromium=sampler.peak_chromium,
+                        )
+                        results.append(result)
+                        print(
+                            f"{scenario:>7} c={level:<3} n={result['requests']:<4} "
+                            f"err={result['errors']:<3} p50={_seconds(result['p50'])} "
+                            f"p95={_seconds(result['p95'])} p99={_seconds(result['p99'])} "
+                            f"rps={result['throughput']:.2f} rss={result['peak_rss_mb']:.0f}MB "
+                            f"chromium={result['peak_chromium']}",
+                            flush=True,
+                        )
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait(timeout=30)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
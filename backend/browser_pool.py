@@ -0,0 +1,147 @@
+"""
+Long-lived headless Chromium shared by all scraping requests.
+
+One browser process is started with the app. Pages are opened in reusable browser
+contexts, the number of simultaneously open pages is capped, and the browser is
+restarted automatically if it crashes.
+"""
+
+from typing import AsyncIterator, Dict, List, Optional
+
+import asyncio
+from contextlib import asynccontextmanager
+from loguru import logger
+from playwright.async_api import Browser, BrowserContext, Page, Playwright, Route, async_playwright
+
+import config
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+
+# We only need text, so don't waste time and memory on downloading these
+BLOCKED_RESOURCE_TYPES = {"image", "font", "media"}
+
+
+async def _block_resources(route: Route) -> None:
+    if route.request.resource_type in BLOCKED_RESOURCE_TYPES:
+        await route.abort()
+    else:
+        await route.continue_()
+
+
+class BrowserPool:
+    """Pool of reusable browser contexts in a single long-lived Chromium process"""
+
+    def __init__(self, max_pages: int, context_max_uses: int):
+        self.max_pages = max_pages
+        self.context_max_uses = context_max_uses
+        self._playwright: Optional[Playwright] = None
+        self._browser: Optional[Browser] = None
+        self._idle_contexts: List[BrowserContext] = []
+        self._context_uses: Dict[BrowserContext, int] = {}
+        self._semaphore = asyncio.Semaphore(max_pages)
+        self._lock = asyncio.Lock()
+        self.in_use = 0
+        self.waiting = 0
+        self.restarts = 0
+
+    @property
+    def playwright(self) -> Playwright:
+        return self._playwright
+
+    async def start(self) -> None:
+        async with self._lock:
+            await self._ensure_browser()
+
+    async def stop(self) -> None:
+        async with self._lock:
+            self._idle_contexts.clear()
+            self._context_uses.clear()
+            if self._browser is not None:
+                try:
+                    await self._browser.close()
+                except Exception as e:
+                    logger.warning(f"Failed to close browser: {str(e)}")
+                self._browser = None
+            if self._playwright is not None:
+                await self._playwright.stop()
+                self._playwright = None
+        logger.info("Browser pool stopped")
+
+    async def _ensure_browser(self) -> Browser:
+        """Start Playwright and Chromium, or restart Chromium if it crashed. Must hold the lock."""
+        if self._playwright is None:
+            self._playwright = await async_playwright().start()
+        if self._browser is None or not self._browser.is_connected():
+            if self._browser is not None:
+                logger.warning("Browser is disconnected, restarting it")
+                self.restarts += 1
+            self._idle_contexts.clear()
+            self._context_uses.clear()
+            self._browser = await self._playwright.chromium.launch(headless=True)
+            logger.info(f"Browser pool started: max_pages={self.max_pages}")
+        return self._browser
+
+    async def _acquire_context(self) -> BrowserContext:
+        async with self._lock:
+            browser = await self._ensure_browser()
+            if self._idle_contexts:
+                return self._idle_contexts.pop()
+            context = await browser.new_context(user_agent=USER_AGENT)
+            await context.route("**/*", _block_resources)
+            self._context_uses[context] = 0
+            return context
+
+    async def _release_context(self, context: BrowserContext) -> None:
+        uses = self._context_uses.get(context, 0) + 1
+        broken = context not in self._context_uses or not self._browser.is_connected()
+        if broken or uses >= self.context_max_uses or len(self._idle_contexts) >= self.max_pages:
+            self._context_uses.pop(context, None)
+            try:
+                await context.close()
+            except Exception as e:
+                logger.debug(f"Failed to close browser context: {str(e)}")
+            return
+        self._context_uses[context] = uses
+        try:
+            # don't leak one site's session into another request
+            await context.clear_cookies()
+        except Exception:
+            self._context_uses.pop(context, None)
+            return
+        self._idle_contexts.append(context)
+
+    @asynccontextmanager
+    async def page(self) -> AsyncIterator[Page]:
+        """Borrow a fresh page, waiting if all pool slots are busy."""
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_use += 1
+        try:
+            context = await self._acquire_context()
+            page = await context.new_page()
+            try:
+                yield page
+            finally:
+                try:
+                    await page.close()
+                except Exception as e:
+                    logger.debug(f"Failed to close page: {str(e)}")
+                await self._release_context(context)
+        finally:
+            self.in_use -= 1
+            self._semaphore.release()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "max_pages": self.max_pages,
+            "in_use": self.in_use,
+            "waiting": self.waiting,
+            "idle_contexts": len(self._idle_contexts),
+            "restarts": self.restarts,
+        }
+
+
+browser_pool = BrowserPool(config.BROWSER_POOL_SIZE, config.BROWSER_CONTEXT_MAX_USES)
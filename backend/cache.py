@@ -0,0 +1,368 @@
+"""
+Two-tier caches (in-memory LRU in front of a SQLite file).
+
+Analysis results are content-addressed, so the same agreement analysed with the
+same model settings and prompt version is answered without calling the LLM again.
+Fetched pages are cached per URL together with their ETag/Last-Modified headers,
+so revisits only need a conditional request.
+"""
+
+from typing import Dict, Iterator, Optional, Sequence, Tuple
+
+import asyncio
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from loguru import logger
+
+import config
+import prompts
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so cosmetic differences in extraction don't change the key."""
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def prompt_version(template: str = prompts.analyze_agreement_prompt) -> str:
+    """Short hash of the prompts, cached results are invalidated when prompts change."""
+    digest = hashlib.sha256((prompts.system_role + template).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def analysis_cache_key(
+    text: str,
+    llm_provider: str,
+    llm_model: str,
+    temperature: float,
+    template: str = prompts.analyze_agreement_prompt,
+    fallbacks: Sequence[Tuple[str, str]] = (),
+) -> str:
+    """
+    Cache key of an agreement (or agreement chunk) analysis.
+    fallbacks are (provider, model) pairs which may have answered instead of the main model.
+    """
+    parts = [
+        hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest(),
+        llm_provider.lower(),
+        llm_model,
+        f"{float(temperature):.3f}",
+        prompt_version(template),
+    ]
+    parts.extend(f"{provider.lower()}/{model}" for provider, model in fallbacks)
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    String cache with an in-memory LRU tier and an optional persistent SQLite tier.
+    Both tiers are bounded by number of entries and by TTL.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        memory_size: int,
+        disk_size: int,
+        ttl: float,
+        db_path: Optional[str] = None,
+    ):
+        self.name = name
+        self.memory_size = memory_size
+        self.disk_size = disk_size
+        self.ttl = ttl
+        self.db_path = db_path
+        self._memory: "OrderedDict[str, tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if self.db_path:
+            with self._connect() as conn:
+                conn.execute(
+                    f"CREATE TABLE IF NOT EXISTS {self.name} ("
+                    "key TEXT PRIMARY KEY, value TEXT, created REAL, accessed REAL)"
+                )
+                conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS {self.name}_accessed ON {self.name} (accessed)"
+                )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _memory_get(self, key: str, now: float) -> Optional[str]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            value, created = entry
+            if now - created > self.ttl:
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+            return value
+
+    def _memory_set(self, key: str, value: str, created: float) -> None:
+        with self._lock:
+            self._memory[key] = (value, created)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def _disk_get(self, key: str, now: float) -> Optional[tuple[str, float]]:
+        if not self.db_path:
+            return None
+        with self._connect() as conn:
+            row = conn.execute(
+                f"SELECT value, created FROM {self.name} WHERE key = ? AND created > ?",
+                (key, now - self.ttl),
+            ).fetchone()
+            if row is not None:
+                conn.execute(f"UPDATE {self.name} SET accessed = ? WHERE key = ?", (now, key))
+        return row
+
+    def _disk_set(self, key: str, value: str, now: float) -> None:
+        if not self.db_path:
+            return
+        with self._connect() as conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO {self.name} (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            conn.execute(f"DELETE FROM {self.name} WHERE created <= ?", (now - self.ttl,))
+            conn.execute(
+                f"DELETE FROM {self.name} WHERE key IN ("
+                f"SELECT key FROM {self.name} ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.disk_size,),
+            )
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        value = self._memory_get(key, now)
+        if value is not None:
+            self.memory_hits += 1
+            return value
+        row = self._disk_get(key, now)
+        if row is not None:
+            self.disk_hits += 1
+            self._memory_set(key, row[0], row[1])
+            return row[0]
+        self.misses += 1
+        return None
+
+    def set(self, key: str, value: str) -> None:
+        now = time.time()
+        self._memory_set(key, value, now)
+        self._disk_set(key, value, now)
+
+    async def aget(self, key: str) -> Optional[str]:
+        """Look up value, the SQLite tier is queried in a worker thread."""
+        now = time.time()
+        value = self._memory_get(key, now)
+        if value is not None:
+            self.memory_hits += 1
+            return value
+        if not self.db_path:
+            self.misses += 1
+            return None
+        return await asyncio.to_thread(self.get, key)
+
+    async def aset(self, key: str, value: str) -> None:
+        """Store value, the SQLite tier is written in a worker thread."""
+        self._memory_set(key, value, time.time())
+        if self.db_path:
+            await asyncio.to_thread(self._disk_set, key, value, time.time())
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            memory_entries = len(self._memory)
+        return {
+            "memory_entries": memory_entries,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+        }
+
+
+@dataclass
+class FetchedPage:
+    """
+    Text extracted from a downloaded page and its HTTP validators.
+    The body itself is not kept, a changed page is downloaded again anyway.
+    """
+
+    url: str
+    text: str
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    fetched_at: float = field(default_factory=time.time)
+
+    def conditional_headers(self) -> Dict[str, str]:
+        """Headers for a conditional GET revalidating this page."""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class FetchCache:
+    """
+    Per-URL cache of downloaded pages. Memory LRU tier in front of an optional SQLite tier.
+    Pages are kept until evicted, freshness is checked by the caller with conditional requests.
+    """
+
+    def __init__(self, memory_size: int, disk_size: int, ttl: float, db_path: Optional[str] = None):
+        self.memory_size = memory_size
+        self.disk_size = disk_size
+        self.ttl = ttl
+        self.db_path = db_path
+        self._memory: "OrderedDict[str, FetchedPage]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        if self.db_path:
+            with self._connect() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS fetched_pages ("
+                    "url TEXT PRIMARY KEY, text TEXT, etag TEXT, last_modified TEXT, fetched_at REAL)"
+                )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _memory_set(self, page: FetchedPage) -> None:
+        with self._lock:
+            self._memory[page.url] = page
+            self._memory.move_to_end(page.url)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def get(self, url: str) -> Optional[FetchedPage]:
+        now = time.time()
+        with self._lock:
+            page = self._memory.get(url)
+            if page is not None and now - page.fetched_at <= self.ttl:
+                self._memory.move_to_end(url)
+                self.hits += 1
+                return page
+        if self.db_path:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT url, text, etag, last_modified, fetched_at FROM fetched_pages "
+                    "WHERE url = ? AND fetched_at > ?",
+                    (url, now - self.ttl),
+                ).fetchone()
+            if row is not None:
+                page = FetchedPage(*row)
+                self._memory_set(page)
+                self.hits += 1
+                return page
+        self.misses += 1
+        return None
+
+    def set(self, page: FetchedPage) -> None:
+        self._memory_set(page)
+        if not self.db_path:
+            return
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO fetched_pages "
+                "(url, text, etag, last_modified, fetched_at) VALUES (?, ?, ?, ?, ?)",
+                (page.url, page.text, page.etag, page.last_modified, page.fetched_at),
+            )
+            conn.execute(
+                "DELETE FROM fetched_pages WHERE url IN ("
+                "SELECT url FROM fetched_pages ORDER BY fetched_at DESC LIMIT -1 OFFSET ?)",
+                (self.disk_size,),
+            )
+
+    def touch(self, page: FetchedPage) -> None:
+        """Mark cached page as fresh after a 304 response."""
+        self.revalidated += 1
+        page.fetched_at = time.time()
+        self.set(page)
+
+    async def aget(self, url: str) -> Optional[FetchedPage]:
+        return await asyncio.to_thread(self.get, url)
+
+    async def aset(self, page: FetchedPage) -> None:
+        await asyncio.to_thread(self.set, page)
+
+    async def atouch(self, page: FetchedPage) -> None:
+        await asyncio.to_thread(self.touch, page)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            memory_entries = len(self._memory)
+        return {
+            "memory_entries": memory_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidated": self.revalidated,
+        }
+
+
+def _create_result_cache(
+    name: str,
+    memory_size: int = config.RESULT_CACHE_MEMORY_SIZE,
+    disk_size: int = config.RESULT_CACHE_DISK_SIZE,
+    ttl: float = config.RESULT_CACHE_TTL,
+) -> ResultCache:
+    try:
+        return ResultCache(
+            name,
+            memory_size=memory_size,
+            disk_size=disk_size,
+            ttl=ttl,
+            db_path=config.CACHE_DB or None,
+        )
+    except sqlite3.Error as e:
+        logger.warning(f"Persistent {name} cache is unavailable, using memory only: {str(e)}")
+        return ResultCache(name, memory_size=memory_size, disk_size=disk_size, ttl=ttl)
+
+
+analysis_cache = _create_result_cache("analysis_results")
+# results of single chunks of long agreements, so edited documents only re-analyse changed parts
+chunk_cache = _create_result_cache("chunk_results")
+# last analysed version of every URL with its clauses and their findings, see incremental.py
+version_store = _create_result_cache(
+    "agreement_versions",
+    memory_size=config.VERSION_STORE_MEMORY_SIZE,
+    disk_size=config.VERSION_STORE_DISK_SIZE,
+    ttl=config.VERSION_STORE_TTL,
+)
+
+try:
+    fetch_cache = FetchCache(
+        memory_size=config.FETCH_CACHE_MEMORY_SIZE,
+        disk_size=config.FETCH_CACHE_DISK_SIZE,
+        ttl=config.FETCH_CACHE_TTL,
+        db_path=config.CACHE_DB or None,
+    )
+except sqlite3.Error as e:
+    logger.warning(f"Persistent fetch cache is unavailable, using memory only: {str(e)}")
+    fetch_cache = FetchCache(
+        memory_size=config.FETCH_CACHE_MEMORY_SIZE,
+        disk_size=config.FETCH_CACHE_DISK_SIZE,
+        ttl=config.FETCH_CACHE_TTL,
+    )
@@ -0,0 +1,151 @@
+"""
+Split long agreements into chunks on clause and section boundaries.
+"""
+
+from typing import Callable, Dict, List, Sequence, Tuple
+
+import hashlib
+import re
+
+from rate_limiter import estimate_tokens
+
+# Lines which usually start a new clause or section: "1.", "2.3", "12)", "Section 4", "Article IV", "§ 5"
+CLAUSE_START = re.compile(
+    r"^\s*("
+    r"\d+(\.\d+)*[.)]?\s+\S"
+    r"|(section|article|clause|chapter|part|раздел|статья|пункт|глава)\s+[\dIVXLC]+"
+    r"|§\s*\d+"
+    r"|[IVXLC]+\.\s+\S"
+    r")",
+    re.IGNORECASE,
+)
+SENTENCE_END = re.compile(r"(?<=[.!?;])\s+")
+# Bullet of clause findings which starts with the clause ID, e.g. "- [C12] High: ..."
+TAGGED_BULLET = re.compile(r"^\s*[-*•]\s*\**\[C(\d+)\]\**\s*[:\-–]?\s*")
+UNTAGGED_BULLET = re.compile(r"^[-*•]\s")
+# Chunks are at least 1/4 and on average about 3/4 of the maximum chunk size
+CHUNK_MIN_SHARE = 0.25
+CHUNK_TARGET_SHARE = 0.75
+
+
+def split_clauses(text: str) -> List[str]:
+    """Split agreement text into clauses, a clause starts at a numbered line or a section header."""
+    clauses = []
+    current: List[str] = []
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        if current and CLAUSE_START.match(line):
+            clauses.append("\n".join(current))
+            current = []
+        current.append(line)
+    if current:
+        clauses.append("\n".join(current))
+    return clauses
+
+
+def _split_oversized(clause: str, max_tokens: int, count_tokens: Callable[[str], int]) -> List[str]:
+    """Split clause which doesn't fit a chunk by lines, then by sentences."""
+    parts = clause.splitlines()
+    if len(parts) == 1:
+        parts = SENTENCE_END.split(clause)
+    if len(parts) == 1:
+        # no boundaries at all, cut by characters proportionally to the token budget
+        size = max(1, len(clause) * max_tokens // max(count_tokens(clause), 1))
+        return [clause[i : i + size] for i in range(0, len(clause), size)]
+    return pack(parts, max_tokens, count_tokens)
+
+
+def pack(
+    parts: List[str], max_tokens: int, count_tokens: Callable[[str], int] = estimate_tokens
+) -> List[str]:
+    """Greedily pack consecutive parts into chunks of at most max_tokens tokens."""
+    chunks = []
+    current: List[str] = []
+    current_tokens = 0
+    for part in parts:
+        tokens = count_tokens(part)
+        if tokens > max_tokens:
+            if current:
+                chunks.append("\n".join(current))
+                current, current_tokens = [], 0
+            chunks.extend(_split_oversized(part, max_tokens, count_tokens))
+            continue
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append("\n".join(current))
+            current, current_tokens = [], 0
+        current.append(part)
+        current_tokens += tokens
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def _is_boundary(clause: str, tokens: int, target_tokens: int) -> bool:
+    """
+    Content-defined chunk boundary after the clause. The chance is proportional to the clause
+    size, so chunks are about target_tokens long whatever the clause sizes are.
+    """
+    normalized = " ".join(clause.lower().split()).encode("utf-8")
+    value = int.from_bytes(hashlib.blake2b(normalized, digest_size=8).digest(), "big")
+    return value < min(1.0, tokens / target_tokens) * 2**64
+
+
+def chunk_text(
+    text: str, max_tokens: int, count_tokens: Callable[[str], int] = estimate_tokens
+) -> List[str]:
+    """
+    Split text into chunks of whole clauses, each at most max_tokens tokens.
+    Chunks end after clauses picked by their content, not when they are full, so inserting
+    or editing a clause only moves the boundaries next to it and other chunks stay cached.
+    """
+    min_tokens = int(max_tokens * CHUNK_MIN_SHARE)
+    # expected size of the chunk part after min_tokens
+    target_tokens = max(1, int(max_tokens * CHUNK_TARGET_SHARE) - min_tokens)
+    chunks = []
+    current: List[str] = []
+    current_tokens = 0
+    for clause in split_clauses(text):
+        tokens = count_tokens(clause)
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append("\n".join(current))
+            current, current_tokens = [], 0
+        if tokens > max_tokens:
+            chunks.extend(_split_oversized(clause, max_tokens, count_tokens))
+            continue
+        current.append(clause)
+        current_tokens += tokens
+        if current_tokens >= min_tokens and _is_boundary(clause, tokens, target_tokens):
+            chunks.append("\n".join(current))
+            current, current_tokens = [], 0
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def tag_clauses(clauses: Dict[int, str]) -> List[str]:
+    """Prefix every clause with its ID, so the model can attribute findings to clauses."""
+    return [f"[C{clause_id}] {clause}" for clause_id, clause in clauses.items()]
+
+
+def parse_tagged_findings(output: str, clause_ids: Sequence[int]) -> Tuple[Dict[int, str], bool]:
+    """
+    Split model output into findings per clause ID. Bullets without a known ID
+    belong to the clause of the previous bullet, or to the first clause of the batch.
+    Also returns whether every top-level bullet had a known ID, i.e. the attribution is reliable.
+    """
+    findings: Dict[int, List[str]] = {}
+    current = clause_ids[0]
+    tagged = True
+    for line in output.splitlines():
+        if not line.strip():
+            continue
+        match = TAGGED_BULLET.match(line)
+        if match and int(match.group(1)) in clause_ids:
+            current = int(match.group(1))
+            line = "- " + line[match.end() :]
+        elif not findings or UNTAGGED_BULLET.match(line):
+            # indented lines continue the previous bullet
+            tagged = False
+        findings.setdefault(current, []).append(line.rstrip())
+    return {clause_id: "\n".join(lines) for clause_id, lines in findings.items()}, tagged
@@ -0,0 +1,195 @@
+"""
+Input compaction between text extraction and the LLM call.
+
+Drops boilerplate (cookie banners, "back to top" links, navigation menus) and
+duplicate lines, counts tokens the way the provider does (as close as we can
+offline) and trims the text to the token budget on clause boundaries.
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+import re
+import time
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+from loguru import logger
+
+from chunking import pack, split_clauses
+from rate_limiter import estimate_tokens
+
+# Short lines matching these are UI leftovers, not agreement text
+BOILERPLATE_LINE = re.compile(
+    r"^(back to top|skip to (main )?content|print( this page)?|share( this)?( on \w+)?|"
+    r"accept( all)?( cookies)?|reject( all)?|cookie (settings|preferences|policy)|"
+    r"manage (cookies|preferences)|we use cookies.*|this (site|website) uses cookies.*|"
+    r"subscribe( to our newsletter)?|sign (in|up)|log ?in|menu|close|search|"
+    r"was this (page|article) helpful\??|yes|no|©.*|copyright ©?.*|all rights reserved\.?)$",
+    re.IGNORECASE,
+)
+BOILERPLATE_MAX_LENGTH = 120
+# Runs of at least this many very short lines without punctuation are menus
+MENU_RUN_LENGTH = 5
+MENU_ITEM_MAX_WORDS = 3
+
+
+@dataclass
+class CompactionReport:
+    original_tokens: int
+    compacted_tokens: int
+    removed_lines: int
+    truncated: bool
+    compaction_ms: float
+    estimated_time_saved_ms: float
+
+    @property
+    def removed_tokens(self) -> int:
+        return self.original_tokens - self.compacted_tokens
+
+    def to_dict(self) -> Dict[str, float]:
+        return {**asdict(self), "removed_tokens": self.removed_tokens}
+
+
+@lru_cache(maxsize=8)
+def _tiktoken_encoding(llm_model: str):
+    """Load the model encoding once. Returns None if it can't be loaded (e.g. no network)."""
+    try:
+        import tiktoken
+
+        try:
+            return tiktoken.encoding_for_model(llm_model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        logger.warning(f"tiktoken is unavailable for {llm_model}, estimating tokens: {str(e)}")
+        return None
+
+
+def count_tokens(text: str, llm_provider: str, llm_model: str) -> int:
+    """
+    Count tokens for the provider. OpenAI models use tiktoken, other providers
+    don't have offline tokenizers, so their count is estimated.
+    """
+    if llm_provider.lower() == "openai":
+        encoding = _tiktoken_encoding(llm_model)
+        if encoding is not None:
+            return len(encoding.encode(text, disallowed_special=()))
+    return estimate_tokens(text)
+
+
+def _normalize_line(line: str) -> str:
+    """
+    Lines which differ only in case, punctuation or spacing are near-duplicates.
+    Numbers are kept, clauses often differ only in amounts, dates or their own number.
+    """
+    return re.sub(r"[\W_]+", " ", line.lower()).strip()
+
+
+def _is_menu_item(line: str) -> bool:
+    # numbers and prices (price tables, clause numbers) are never navigation
+    if re.search(r"\d|[$€£¥₹]", line):
+        return False
+    return len(line.split()) <= MENU_ITEM_MAX_WORDS and not re.search(r"[.:;,!?]$", line)
+
+
+def remove_boilerplate(text: str) -> Tuple[str, int]:
+    """Drop boilerplate lines, menus and duplicate lines. Return text and number of removed lines."""
+    lines = [line.strip() for line in text.splitlines()]
+    lines = [line for line in lines if line]
+    keep = [True] * len(lines)
+
+    # navigation menus: long runs of short link-like lines
+    run_start = None
+    for i, line in enumerate(lines + [""]):
+        if line and _is_menu_item(line):
+            if run_start is None:
+                run_start = i
+            continue
+        if run_start is not None and i - run_start >= MENU_RUN_LENGTH:
+            for j in range(run_start, i):
+                keep[j] = False
+        run_start = None
+
+    seen = set()
+    for i, line in enumerate(lines):
+        if not keep[i]:
+            continue
+        if len(line) <= BOILERPLATE_MAX_LENGTH and BOILERPLATE_LINE.match(line):
+            keep[i] = False
+            continue
+        normalized = _normalize_line(line)
+        # very short lines (numbers, "Yes") are too ambiguous to deduplicate
+        if len(normalized) < 20:
+            continue
+        if normalized in seen:
+            keep[i] = False
+        seen.add(normalized)
+
+    compacted = [line for line, kept in zip(lines, keep) if kept]
+    return "\n".join(compacted), len(lines) - len(compacted)
+
+
+def fit_to_budget(
+    text: str, max_tokens: int, llm_provider: str, llm_model: str
+) -> Tuple[str, bool]:
+    """
+    Keep whole clauses from the start of the text until the token budget is used up.
+    The clause which doesn't fit is split by lines or sentences to fill the rest of the budget.
+    """
+
+    def counter(part: str) -> int:
+        return count_tokens(part, llm_provider, llm_model)
+
+    if counter(text) <= max_tokens:
+        return text, False
+    kept: List[str] = []
+    used = 0
+    for clause in split_clauses(text):
+        tokens = counter(clause)
+        if used + tokens <= max_tokens:
+            kept.append(clause)
+            used += tokens
+            continue
+        for part in pack([clause], max(1, max_tokens - used), counter):
+            rest = max_tokens - used
+            tokens = counter(part)
+            if tokens >= rest:
+                # token counts of the pieces don't add up exactly, cut the last one to the budget
+                if rest > 0:
+                    kept.append(part[: len(part) * rest // tokens])
+                break
+            kept.append(part)
+            used += tokens
+        break
+    return "\n".join(kept), True
+
+
+def compact(
+    text: str,
+    llm_provider: str,
+    llm_model: str,
+    max_tokens: Optional[int],
+    prefill_tokens_per_second: float,
+) -> Tuple[str, CompactionReport]:
+    """Compact text for the prompt and report how many tokens and how much time it saved."""
+    started = time.perf_counter()
+    original_tokens = count_tokens(text, llm_provider, llm_model)
+    compacted, removed_lines = remove_boilerplate(text)
+    truncated = False
+    if max_tokens:
+        compacted, truncated = fit_to_budget(compacted, max_tokens, llm_provider, llm_model)
+    compacted_tokens = count_tokens(compacted, llm_provider, llm_model)
+    report = CompactionReport(
+        original_tokens=original_tokens,
+        compacted_tokens=compacted_tokens,
+        removed_lines=removed_lines,
+        truncated=truncated,
+        compaction_ms=round((time.perf_counter() - started) * 1000, 1),
+        estimated_time_saved_ms=round(
+            (original_tokens - compacted_tokens) / prefill_tokens_per_second * 1000, 1
+        ),
+    )
+    logger.info(
+        f"Compacted input: {original_tokens} -> {compacted_tokens} tokens, "
+        f"{removed_lines} lines removed, truncated={truncated}"
+    )
+    return compacted, report
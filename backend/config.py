@@ -0,0 +1,127 @@
+"""
+Server settings. Every value can be overridden with an environment variable
+(or a .env file next to the server).
+"""
+
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def _int(name: str, default: int) -> int:
+    return int(os.getenv(name, default))
+
+
+def _float(name: str, default: float) -> float:
+    return float(os.getenv(name, default))
+
+
+# Pool of LLM clients shared between requests
+ANSWERER_POOL_SIZE = _int("ANSWERER_POOL_SIZE", 32)
+ANSWERER_POOL_TTL = _float("ANSWERER_POOL_TTL", 30 * 60)
+
+# Free tier rate limiter, shared by all requests with the same provider and API key.
+# Use "sqlite" backend to share one budget between several uvicorn workers.
+FREE_TIER_TPM_LIMIT = _int("FREE_TIER_TPM_LIMIT", 250_000)
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_DB = os.getenv("RATE_LIMIT_DB", "rate_limits.sqlite3")
+
+# Analysis result cache. Empty CACHE_DB disables the persistent tier.
+CACHE_DB = os.getenv("CACHE_DB", "cache.sqlite3")
+RESULT_CACHE_MEMORY_SIZE = _int("RESULT_CACHE_MEMORY_SIZE", 256)
+RESULT_CACHE_DISK_SIZE = _int("RESULT_CACHE_DISK_SIZE", 10_000)
+RESULT_CACHE_TTL = _float("RESULT_CACHE_TTL", 7 * 24 * 60 * 60)
+
+# Fetched pages cache, revisits are revalidated with conditional requests
+FETCH_CACHE_MEMORY_SIZE = _int("FETCH_CACHE_MEMORY_SIZE", 128)
+FETCH_CACHE_DISK_SIZE = _int("FETCH_CACHE_DISK_SIZE", 2_000)
+FETCH_CACHE_TTL = _float("FETCH_CACHE_TTL", 30 * 24 * 60 * 60)
+
+# Last analysed version of every URL with per-clause findings, for incremental re-analysis
+VERSION_STORE_MEMORY_SIZE = _int("VERSION_STORE_MEMORY_SIZE", 128)
+VERSION_STORE_DISK_SIZE = _int("VERSION_STORE_DISK_SIZE", 10_000)
+VERSION_STORE_TTL = _float("VERSION_STORE_TTL", 90 * 24 * 60 * 60)
+# Limit of clauses of each kind listed in the "what changed" part of the prompt
+CHANGES_MAX_CLAUSES = _int("CHANGES_MAX_CLAUSES", 30)
+
+# Headless browser pool used for scraping
+BROWSER_POOL_SIZE = _int("BROWSER_POOL_SIZE", 4)
+BROWSER_CONTEXT_MAX_USES = _int("BROWSER_CONTEXT_MAX_USES", 50)
+
+# Tiered fetching: plain HTTP first, Chromium only for pages that need JavaScript
+HTTP_TIMEOUT = _float("HTTP_TIMEOUT", 30)
+STATIC_MIN_TEXT_LENGTH = _int("STATIC_MIN_TEXT_LENGTH", 500)
+DOMAIN_TIER_MEMORY_SIZE = _int("DOMAIN_TIER_MEMORY_SIZE", 1_000)
+DOMAIN_TIER_TTL = _float("DOMAIN_TIER_TTL", 24 * 60 * 60)
+
+# PDF extraction. Downloads above PDF_SPOOL_SIZE are written to a temp file instead of RAM.
+PDF_MAX_BYTES = _int("PDF_MAX_BYTES", 50 * 1024 * 1024)
+PDF_MAX_PAGES = _int("PDF_MAX_PAGES", 1_000)
+PDF_SPOOL_SIZE = _int("PDF_SPOOL_SIZE", 8 * 1024 * 1024)
+PDF_WORKERS = _int("PDF_WORKERS", 4)
+PDF_PAGES_PER_TASK = _int("PDF_PAGES_PER_TASK", 16)
+
+# Long agreements are analysed in chunks (map) and the results are merged (reduce)
+CHUNK_THRESHOLD_TOKENS = _int("CHUNK_THRESHOLD_TOKENS", 24_000)
+CHUNK_MAX_TOKENS = _int("CHUNK_MAX_TOKENS", 8_000)
+CHUNK_CONCURRENCY = _int("CHUNK_CONCURRENCY", 4)
+
+# Background analysis jobs (POST /jobs)
+JOB_WORKERS = _int("JOB_WORKERS", 8)
+JOB_QUEUE_SIZE = _int("JOB_QUEUE_SIZE", 100)
+JOB_SCRAPE_CONCURRENCY = _int("JOB_SCRAPE_CONCURRENCY", 4)
+JOB_LLM_CONCURRENCY = _int("JOB_LLM_CONCURRENCY", 8)
+JOB_RESULT_TTL = _float("JOB_RESULT_TTL", 60 * 60)
+JOB_RETRY_AFTER = _int("JOB_RETRY_AFTER", 10)
+
+# Batch analysis (POST /analyze/batch), limits are per batch
+BATCH_MAX_ITEMS = _int("BATCH_MAX_ITEMS", 200)
+BATCH_SCRAPE_CONCURRENCY = _int("BATCH_SCRAPE_CONCURRENCY", 8)
+BATCH_LLM_CONCURRENCY = _int("BATCH_LLM_CONCURRENCY", 16)
+
+# Add Server-Timing header with per-stage durations to responses
+SERVER_TIMING = os.getenv("SERVER_TIMING", "1") == "1"
+
+# Allow provider "Fake" (bench/fake_llm.py), only for offline benchmarks
+ENABLE_FAKE_LLM = os.getenv("ENABLE_FAKE_LLM", "0") == "1"
+
+# Input compaction before prompting. Texts above the budget are cut on clause boundaries.
+INPUT_TOKEN_BUDGET = _int("INPUT_TOKEN_BUDGET", 200_000)
+# Rough provider prompt processing speed, used to estimate the time saved by compaction
+PREFILL_TOKENS_PER_SECOND = _float("PREFILL_TOKENS_PER_SECOND", 5_000)
+
+# LLM routing: retries of transient errors, circuit breakers and hedging over fallback backends
+LLM_RETRIES = _int("LLM_RETRIES", 2)
+LLM_RETRY_BASE_DELAY = _float("LLM_RETRY_BASE_DELAY", 1.0)
+LLM_RETRY_MAX_DELAY = _float("LLM_RETRY_MAX_DELAY", 10.0)
+BREAKER_FAILURE_THRESHOLD = _int("BREAKER_FAILURE_THRESHOLD", 5)
+BREAKER_RESET_TIMEOUT = _float("BREAKER_RESET_TIMEOUT", 30.0)
+# Hedge after the observed p95 time to first token, or after the default delay until enough samples
+HEDGE_DEFAULT_DELAY = _float("HEDGE_DEFAULT_DELAY", 5.0)
+HEDGE_MIN_SAMPLES = _int("HEDGE_MIN_SAMPLES", 20)
+HEDGE_WINDOW_SIZE = _int("HEDGE_WINDOW_SIZE", 200)
+
+# Provider-side caching of the static prompt prefix (system role and instructions).
+# Providers don't cache prefixes below their minimum, so caching is only requested above it.
+# The shipped prompts have prefixes of about 300-500 tokens, only Ollama keeps them warm.
+GEMINI_CACHE_MIN_TOKENS = _int("GEMINI_CACHE_MIN_TOKENS", 1024)
+OPENAI_CACHE_MIN_TOKENS = _int("OPENAI_CACHE_MIN_TOKENS", 1024)
+CLAUDE_CACHE_MIN_TOKENS = _int("CLAUDE_CACHE_MIN_TOKENS", 1024)
+GEMINI_CACHE_TTL = _int("GEMINI_CACHE_TTL", 60 * 60)
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+
+# Clause fingerprint index: findings of clauses seen before are reused instead of sending
+# the clauses to the LLM again
+CLAUSE_INDEX = os.getenv("CLAUSE_INDEX", "0") == "1"
+CLAUSE_INDEX_SIZE = _int("CLAUSE_INDEX_SIZE", 50_000)
+# Long agreements (above CHUNK_THRESHOLD_TOKENS) with at least this many clauses are analysed
+# clause by clause through the index instead of in chunks
+CLAUSE_INDEX_MIN_CLAUSES = _int("CLAUSE_INDEX_MIN_CLAUSES", 20)
+# Reuse findings of near-duplicate clauses, not only of exact matches after normalization
+CLAUSE_NEAR_DUPLICATES = os.getenv("CLAUSE_NEAR_DUPLICATES", "0") == "1"
+CLAUSE_SIMILARITY_THRESHOLD = _float("CLAUSE_SIMILARITY_THRESHOLD", 0.85)
+SHINGLE_SIZE = _int("SHINGLE_SIZE", 3)
+MINHASH_PERMUTATIONS = _int("MINHASH_PERMUTATIONS", 128)
+LSH_BANDS = _int("LSH_BANDS", 16)
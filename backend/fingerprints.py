@@ -0,0 +1,329 @@
+"""
+Index of clause fingerprints mapped to the findings produced for them.
+
+Agreements share a lot of boilerplate (indemnity, arbitration, auto-renewal clauses).
+Every analysed clause is stored with an exact hash of its normalized text and a MinHash
+signature. A clause seen before is answered from the index and only novel clauses are sent
+to the LLM. Near-duplicates found through LSH buckets are only reused when enabled, and only
+if they have the same numbers, negations, modal verbs and parties in the same order.
+"""
+
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+import asyncio
+import hashlib
+import random
+import re
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from loguru import logger
+
+import config
+import metrics
+
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+# clause numbers and section headers differ between documents with the same clause
+LEADING_NUMBER = re.compile(
+    r"^\s*((\d+(\.\d+)*[.)]?)|((section|article|clause|§)\s*[\dIVXLC.]+[.)]?)|([IVXLC]+\.))\s*",
+    re.IGNORECASE,
+)
+
+# words which change the meaning of a clause while barely changing its shingles
+# ("t" is what is left of "can't" or "won't" after normalization)
+ANCHOR_WORDS = frozenset(
+    "not no never neither nor none without cannot t except unless only "
+    "may shall must will can should might would "
+    "we us our ours you your yours they them their company user users customer customers "
+    "licensor licensee provider party parties".split()
+)
+
+# fixed seed, signatures must stay comparable between restarts
+_random = random.Random(1729)
+_PERMUTATIONS = [
+    (_random.randrange(1, MERSENNE_PRIME), _random.randrange(0, MERSENNE_PRIME))
+    for _ in range(config.MINHASH_PERMUTATIONS)
+]
+
+
+def normalize_clause(clause: str) -> str:
+    """Lowercase, drop the clause number and punctuation, collapse whitespace."""
+    clause = LEADING_NUMBER.sub("", clause.strip())
+    return re.sub(r"[\W_]+", " ", clause.lower()).strip()
+
+
+def _hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def minhash(normalized: str) -> Tuple[int, ...]:
+    """MinHash signature of word shingles of the normalized clause."""
+    words = normalized.split()
+    size = config.SHINGLE_SIZE
+    shingles = {" ".join(words[i : i + size]) for i in range(max(1, len(words) - size + 1))}
+    hashes = [_hash64(shingle) for shingle in shingles]
+    return tuple(
+        min(((a * h + b) % MERSENNE_PRIME) & MAX_HASH for h in hashes) for a, b in _PERMUTATIONS
+    )
+
+
+def similarity(first: Tuple[int, ...], second: Tuple[int, ...]) -> float:
+    """Estimated Jaccard similarity of two signatures."""
+    return sum(a == b for a, b in zip(first, second)) / len(first)
+
+
+@dataclass
+class Fingerprint:
+    exact: str
+    # numbers (amounts, periods, dates) and ANCHOR_WORDS of the clause in order,
+    # near-duplicates must have the same ones
+    anchors: str
+    signature: Tuple[int, ...]
+
+    @classmethod
+    def of(cls, clause: str) -> "Fingerprint":
+        normalized = normalize_clause(clause)
+        exact = hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+        anchors = " ".join(
+            word for word in normalized.split() if word.isdigit() or word in ANCHOR_WORDS
+        )
+        return cls(exact, anchors, minhash(normalized))
+
+    def bands(self) -> Iterator[Tuple[int, Tuple[int, ...]]]:
+        rows = len(self.signature) // config.LSH_BANDS
+        for band in range(config.LSH_BANDS):
+            yield band, self.signature[band * rows : (band + 1) * rows]
+
+
+@dataclass
+class IndexEntry:
+    namespace: str
+    fingerprint: Fingerprint
+    findings: str
+    created: float
+
+
+class ClauseIndex:
+    """
+    In-memory clause index with exact and (if near_duplicates is on) LSH lookups,
+    optionally persisted to SQLite. Entries are namespaced by model settings and prompt version,
+    findings of one model are not reused for another. The oldest entries are evicted above max_size.
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        ttl: float,
+        threshold: float,
+        near_duplicates: bool = False,
+        db_path: Optional[str] = None,
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.threshold = threshold
+        self.near_duplicates = near_duplicates
+        self.db_path = db_path
+        self._entries: "OrderedDict[int, IndexEntry]" = OrderedDict()
+        self._exact: Dict[Tuple[str, str], int] = {}
+        self._buckets: Dict[Tuple[str, int, Tuple[int, ...]], Set[int]] = {}
+        self._next_memory_id = -1
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.lookup_time = 0.0
+        if self.db_path:
+            with self._connect() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS clause_fingerprints ("
+                    "id INTEGER PRIMARY KEY, namespace TEXT, exact TEXT, anchors TEXT, signature BLOB, "
+                    "findings TEXT, created REAL)"
+                )
+            self._load()
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _load(self) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "DELETE FROM clause_fingerprints WHERE created <= ?", (time.time() - self.ttl,)
+            )
+            rows = conn.execute(
+                "SELECT id, namespace, exact, anchors, signature, findings, created "
+                "FROM clause_fingerprints "
+                "ORDER BY id DESC LIMIT ?",
+                (self.max_size,),
+            ).fetchall()
+        for entry_id, namespace, exact, anchors, signature, findings, created in reversed(rows):
+            fingerprint = Fingerprint(exact, anchors, tuple(array("Q", signature)))
+            self._insert(entry_id, IndexEntry(namespace, fingerprint, findings, created))
+        logger.info(f"Loaded {len(rows)} clause fingerprints")
+
+    def _insert(self, entry_id: int, entry: IndexEntry) -> None:
+        self._entries[entry_id] = entry
+        self._exact[(entry.namespace, entry.fingerprint.exact)] = entry_id
+        for band, rows in entry.fingerprint.bands():
+            self._buckets.setdefault((entry.namespace, band, rows), set()).add(entry_id)
+
+    def _remove(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id)
+        key = (entry.namespace, entry.fingerprint.exact)
+        if self._exact.get(key) == entry_id:
+            del self._exact[key]
+        for band, rows in entry.fingerprint.bands():
+            bucket = self._buckets.get((entry.namespace, band, rows))
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[(entry.namespace, band, rows)]
+
+    def _find(self, namespace: str, fingerprint: Fingerprint, now: float) -> Optional[IndexEntry]:
+        entry_id = self._exact.get((namespace, fingerprint.exact))
+        if entry_id is not None and now - self._entries[entry_id].created <= self.ttl:
+            self.exact_hits += 1
+            return self._entries[entry_id]
+        if not self.near_duplicates:
+            self.misses += 1
+            return None
+        candidates: Set[int] = set()
+        for band, rows in fingerprint.bands():
+            candidates |= self._buckets.get((namespace, band, rows), set())
+        best, best_similarity = None, self.threshold
+        for candidate_id in candidates:
+            entry = self._entries[candidate_id]
+            if now - entry.created > self.ttl or entry.fingerprint.anchors != fingerprint.anchors:
+                continue
+            score = similarity(fingerprint.signature, entry.fingerprint.signature)
+            if score >= best_similarity:
+                best, best_similarity = entry, score
+        if best is not None:
+            self.near_hits += 1
+        else:
+            self.misses += 1
+        return best
+
+    def lookup(
+        self, namespace: str, clauses: Dict[int, str]
+    ) -> Tuple[Dict[int, str], Dict[int, Fingerprint]]:
+        """
+        Look up clauses (clause ID -> text).
+        Returns findings of known clauses ("" if they have no red flags) and fingerprints of all clauses.
+        """
+        with metrics.timed("clause_lookup"):
+            started = time.perf_counter()
+            fingerprints = {i: Fingerprint.of(clause) for i, clause in clauses.items()}
+            known = {}
+            now = time.time()
+            with self._lock:
+                for i, fingerprint in fingerprints.items():
+                    entry = self._find(namespace, fingerprint, now)
+                    if entry is not None:
+                        known[i] = entry.findings
+                self.lookup_time += time.perf_counter() - started
+        return known, fingerprints
+
+    def _store(self, namespace: str, items: List[Tuple[Fingerprint, str]], now: float) -> List[int]:
+        """Insert rows, SQLite assigns their IDs so workers sharing the database don't collide."""
+        with self._connect() as conn:
+            return [
+                conn.execute(
+                    "INSERT INTO clause_fingerprints "
+                    "(namespace, exact, anchors, signature, findings, created) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        namespace,
+                        fingerprint.exact,
+                        fingerprint.anchors,
+                        array("Q", fingerprint.signature).tobytes(),
+                        findings,
+                        now,
+                    ),
+                ).lastrowid
+                for fingerprint, findings in items
+            ]
+
+    def add(self, namespace: str, items: List[Tuple[Fingerprint, str]]) -> None:
+        """Store findings of analysed clauses. Failing to persist them only logs a warning."""
+        now = time.time()
+        ids: Optional[List[int]] = None
+        if self.db_path and items:
+            try:
+                ids = self._store(namespace, items, now)
+            except sqlite3.Error as e:
+                logger.warning(f"Failed to persist clause fingerprints: {str(e)}")
+        evicted = []
+        with self._lock:
+            if ids is None:
+                # entries only kept in memory get negative IDs, they never clash with rows
+                ids = list(range(self._next_memory_id, self._next_memory_id - len(items), -1))
+                self._next_memory_id -= len(items)
+            for entry_id, (fingerprint, findings) in zip(ids, items):
+                previous_id = self._exact.get((namespace, fingerprint.exact))
+                if previous_id is not None:
+                    self._remove(previous_id)
+                    evicted.append(previous_id)
+                self._insert(entry_id, IndexEntry(namespace, fingerprint, findings, now))
+            while len(self._entries) > self.max_size:
+                entry_id = next(iter(self._entries))
+                self._remove(entry_id)
+                evicted.append(entry_id)
+        evicted = [entry_id for entry_id in evicted if entry_id > 0]
+        if self.db_path and evicted:
+            try:
+                with self._connect() as conn:
+                    conn.executemany(
+                        "DELETE FROM clause_fingerprints WHERE id = ?", [(i,) for i in evicted]
+                    )
+            except sqlite3.Error as e:
+                logger.warning(f"Failed to delete evicted clause fingerprints: {str(e)}")
+
+    async def alookup(
+        self, namespace: str, clauses: Dict[int, str]
+    ) -> Tuple[Dict[int, str], Dict[int, Fingerprint]]:
+        """Look up clauses in a worker thread, hashing many clauses takes a while."""
+        return await asyncio.to_thread(self.lookup, namespace, clauses)
+
+    async def aadd(self, namespace: str, items: List[Tuple[Fingerprint, str]]) -> None:
+        await asyncio.to_thread(self.add, namespace, items)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.exact_hits + self.near_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "exact_hits": self.exact_hits,
+                "near_hits": self.near_hits,
+                "misses": self.misses,
+                "hit_rate": (self.exact_hits + self.near_hits) / lookups if lookups else 0.0,
+                "avg_lookup_ms": self.lookup_time / lookups * 1000 if lookups else 0.0,
+            }
+
+
+def _create_clause_index() -> ClauseIndex:
+    settings = dict(
+        max_size=config.CLAUSE_INDEX_SIZE,
+        ttl=config.RESULT_CACHE_TTL,
+        threshold=config.CLAUSE_SIMILARITY_THRESHOLD,
+        near_duplicates=config.CLAUSE_NEAR_DUPLICATES,
+    )
+    try:
+        return ClauseIndex(**settings, db_path=config.CACHE_DB or None)
+    except sqlite3.Error as e:
+        logger.warning(f"Persistent clause index is unavailable, using memory only: {str(e)}")
+        return ClauseIndex(**settings)
+
+
+clause_index = _create_clause_index()
@@ -0,0 +1,218 @@
+"""
+Incremental re-analysis of changed agreement versions.
+
+The last analysed version of every URL is stored with its clauses and their findings.
+A new version is diffed against it clause by clause: findings of unchanged clauses are
+reused, and only added or modified clauses are sent to the LLM. Findings the model didn't
+attribute to single clauses are stored for their group of clauses, and the whole group is
+analysed again when one of its clauses changes. The final analysis is merged from all
+findings and gets a "what changed" section.
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+import hashlib
+import json
+from dataclasses import asdict, dataclass, field
+from difflib import SequenceMatcher
+from loguru import logger
+
+import config
+import prompts
+from cache import normalize_text, prompt_version, version_store
+from chunking import split_clauses
+from llm import GPTAnswerer
+
+
+@dataclass
+class StoredClause:
+    hash: str
+    text: str
+    findings: str = ""
+    # index of the clause group in AgreementVersion.groups if findings are kept for the group
+    group: Optional[int] = None
+
+
+@dataclass
+class AgreementVersion:
+    clauses: List[StoredClause]
+    report: str
+    # findings of clause groups
+    groups: List[str] = field(default_factory=list)
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self), ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, data: str) -> "AgreementVersion":
+        raw = json.loads(data)
+        return cls(
+            clauses=[StoredClause(**c) for c in raw["clauses"]],
+            report=raw["report"],
+            groups=raw.get("groups", []),
+        )
+
+    def findings(self) -> List[str]:
+        clause_findings = [clause.findings for clause in self.clauses]
+        return [findings for findings in clause_findings + self.groups if findings]
+
+
+@dataclass
+class ClauseDiff:
+    # indexes of the new clauses, and the old clauses they replace
+    unchanged: Dict[int, StoredClause] = field(default_factory=dict)
+    modified: Dict[int, StoredClause] = field(default_factory=dict)
+    added: List[int] = field(default_factory=list)
+    removed: List[StoredClause] = field(default_factory=list)
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.modified or self.added or self.removed)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "unchanged": len(self.unchanged),
+            "modified": len(self.modified),
+            "added": len(self.added),
+            "removed": len(self.removed),
+        }
+
+
+def clause_hash(clause: str) -> str:
+    return hashlib.sha256(normalize_text(clause).encode("utf-8")).hexdigest()
+
+
+def version_key(url: str, answerer: GPTAnswerer) -> str:
+    """Findings depend on the model and prompts, so versions are stored per model settings."""
+    adapter = answerer.ai_adapter
+    parts = [
+        url,
+        adapter.model_provider.lower(),
+        adapter.llm_model,
+        f"{float(adapter.temperature):.3f}",
+        prompt_version(prompts.analyze_clauses_prompt),
+    ]
+    parts.extend(f"{provider.lower()}/{model}" for provider, model in answerer.fallback_models)
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+
+
+def diff_clauses(old: List[StoredClause], new: List[str]) -> ClauseDiff:
+    """Match clauses of the new version to the old one, edited clauses are paired in order."""
+    diff = ClauseDiff()
+    new_hashes = [clause_hash(clause) for clause in new]
+    matcher = SequenceMatcher(None, [c.hash for c in old], new_hashes, autojunk=False)
+    for tag, old_start, old_end, new_start, new_end in matcher.get_opcodes():
+        if tag == "equal":
+            for offset in range(new_end - new_start):
+                diff.unchanged[new_start + offset] = old[old_start + offset]
+            continue
+        paired = min(old_end - old_start, new_end - new_start)
+        for offset in range(paired):
+            diff.modified[new_start + offset] = old[old_start + offset]
+        diff.added.extend(range(new_start + paired, new_end))
+        diff.removed.extend(old[old_start + paired : old_end])
+    return diff
+
+
+def _shorten(text: str, limit: int = 500) -> str:
+    text = normalize_text(text)
+    return text if len(text) <= limit else text[:limit] + "..."
+
+
+def describe_changes(diff: ClauseDiff, clauses: List[str], first_version: bool) -> str:
+    """Describe changed clauses for the merge prompt."""
+    if first_version:
+        return "This is the first analysed version of the agreement."
+    limit = config.CHANGES_MAX_CLAUSES
+    lines = []
+    if diff.added:
+        lines.append("Added clauses:")
+        lines.extend(f"- {_shorten(clauses[i])}" for i in diff.added[:limit])
+    if diff.modified:
+        lines.append("Modified clauses:")
+        for i, old in list(diff.modified.items())[:limit]:
+            lines.append(f"- Before: {_shorten(old.text)}\n  After: {_shorten(clauses[i])}")
+    if diff.removed:
+        lines.append("Removed clauses:")
+        for old in diff.removed[:limit]:
+            # findings of a clause group can't be attributed to the removed clause
+            had_flags = " (had red flags)" if old.findings and old.group is None else ""
+            lines.append(f"- {_shorten(old.text)}{had_flags}")
+    omitted = max(0, len(diff.added) - limit) + max(0, len(diff.modified) - limit)
+    omitted += max(0, len(diff.removed) - limit)
+    if omitted:
+        lines.append(f"... and {omitted} more changed clauses.")
+    return "\n".join(lines)
+
+
+async def load_version(key: str) -> Optional[AgreementVersion]:
+    data = await version_store.aget(key)
+    if data is None:
+        return None
+    try:
+        return AgreementVersion.from_json(data)
+    except (ValueError, KeyError, TypeError) as e:
+        logger.warning(f"Ignoring unreadable stored agreement version: {str(e)}")
+        return None
+
+
+async def analyze_incremental(
+    answerer: GPTAnswerer, url: str, text: str
+) -> Tuple[str, Dict[str, int]]:
+    """
+    Analyze the agreement at url, re-analysing only clauses changed since the stored version.
+    Returns the analysis and clause change counts.
+    """
+    key = version_key(url, answerer)
+    previous = await load_version(key)
+    clauses = split_clauses(text)
+    diff = diff_clauses(previous.clauses if previous else [], clauses)
+    stats = {**diff.stats(), "first_version": previous is None, "analyzed_clauses": 0}
+    if previous is not None and not diff.changed:
+        logger.info(f"Agreement at {url} has not changed, reusing stored analysis")
+        return previous.report, stats
+
+    # unchanged clauses of a group with a changed clause are analysed again with it
+    kept = {id(old) for old in diff.unchanged.values()}
+    old_clauses = previous.clauses if previous else []
+    broken_groups = {
+        old.group for old in old_clauses if old.group is not None and id(old) not in kept
+    }
+    reused = {i: old for i, old in diff.unchanged.items() if old.group not in broken_groups}
+    to_analyze = {i: clauses[i] for i in range(len(clauses)) if i not in reused}
+    stats["analyzed_clauses"] = len(to_analyze)
+    logger.info(
+        f"Incremental analysis of {url}: {len(to_analyze)} of {len(clauses)} clauses to analyse"
+    )
+    findings, new_groups = await answerer.aanalyze_clauses(to_analyze) if to_analyze else ({}, [])
+
+    groups: List[str] = []
+    group_of: Dict[int, int] = {}
+    old_group_ids: Dict[int, int] = {}
+    for i, old in reused.items():
+        if old.group is not None:
+            if old.group not in old_group_ids:
+                old_group_ids[old.group] = len(groups)
+                groups.append(previous.groups[old.group])
+            group_of[i] = old_group_ids[old.group]
+    for group in new_groups:
+        groups.append("\n".join(filter(None, (findings.pop(i, "") for i in group))))
+        group_of.update({i: len(groups) - 1 for i in group})
+
+    stored_clauses = []
+    for i, clause in enumerate(clauses):
+        if i in group_of:
+            clause_findings = ""
+        elif i in reused:
+            clause_findings = reused[i].findings
+        else:
+            clause_findings = findings.get(i, "")
+        stored_clauses.append(
+            StoredClause(clause_hash(clause), clause, clause_findings, group_of.get(i))
+        )
+
+    changes = describe_changes(diff, clauses, first_version=previous is None)
+    version = AgreementVersion(stored_clauses, "", groups)
+    version.report = await answerer.amerge_findings(version.findings(), changes)
+    await version_store.aset(key, version.to_json())
+    return version.report, stats
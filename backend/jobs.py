@@ -0,0 +1,149 @@
+"""
+Background analysis jobs.
+
+Jobs are put into a bounded queue and processed by a fixed number of workers.
+Pipeline stages (scraping and LLM analysis) have their own concurrency limits,
+finished jobs are kept for a limited time so clients can poll their results.
+"""
+
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import asyncio
+import time
+import uuid
+from dataclasses import dataclass, field
+from loguru import logger
+from fastapi import HTTPException
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class QueueFullError(Exception):
+    pass
+
+
+@dataclass
+class Job:
+    id: str
+    payload: Any
+    status: str = QUEUED
+    result: Any = None
+    error: Optional[str] = None
+    status_code: Optional[int] = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {"job_id": self.id, "status": self.status, "created_at": self.created_at}
+        if self.status == DONE:
+            # handlers may return the result together with its metadata
+            if isinstance(self.result, dict):
+                data.update(self.result)
+            else:
+                data["result"] = self.result
+        elif self.status == FAILED:
+            data["error"] = self.error
+            data["status_code"] = self.status_code
+        if self.finished_at is not None:
+            data["finished_at"] = self.finished_at
+        return data
+
+
+class JobQueue:
+    """Bounded queue of jobs processed by a pool of asyncio workers"""
+
+    def __init__(
+        self,
+        handler: Callable[[Any, "JobQueue"], Awaitable[Any]],
+        workers: int,
+        max_queue_size: int,
+        stage_limits: Dict[str, int],
+        result_ttl: float,
+    ):
+        self.handler = handler
+        self.workers = workers
+        self.result_ttl = result_ttl
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue_size)
+        self._stages = {name: asyncio.Semaphore(limit) for name, limit in stage_limits.items()}
+        self._jobs: Dict[str, Job] = {}
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        logger.info(f"Job queue started: {self.workers} workers, queue size {self._queue.maxsize}")
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stage(self, name: str) -> asyncio.Semaphore:
+        """Concurrency limit of a pipeline stage, use as `async with queue.stage("llm"):`."""
+        return self._stages[name]
+
+    def _cleanup(self) -> None:
+        now = time.time()
+        expired = [
+            job_id
+            for job_id, job in self._jobs.items()
+            if job.finished_at is not None and now - job.finished_at > self.result_ttl
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def submit(self, payload: Any) -> Job:
+        """Put new job into the queue, raise QueueFullError if there is no room for it."""
+        self._cleanup()
+        job = Job(id=uuid.uuid4().hex, payload=payload)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFullError("Job queue is full")
+        self._jobs[job.id] = job
+        logger.info(f"Job {job.id} queued, {self._queue.qsize()} jobs in queue")
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        self._cleanup()
+        return self._jobs.get(job_id)
+
+    async def _worker(self, worker_id: int) -> None:
+        while True:
+            job = await self._queue.get()
+            job.status = RUNNING
+            logger.debug(f"Worker {worker_id} started job {job.id}")
+            try:
+                job.result = await self.handler(job.payload, self)
+                job.status = DONE
+            except HTTPException as e:
+                job.status = FAILED
+                job.error = str(e.detail)
+                job.status_code = e.status_code
+            except Exception as e:
+                logger.error(f"Job {job.id} failed: {str(e)}", exc_info=True)
+                job.status = FAILED
+                job.error = str(e)
+                job.status_code = 500
+            finally:
+                # don't keep API keys and documents longer than needed
+                job.payload = None
+                job.finished_at = time.time()
+                self._queue.task_done()
+            logger.info(f"Job {job.id} finished with status {job.status}")
+
+    def stats(self) -> Dict[str, int]:
+        statuses = [job.status for job in self._jobs.values()]
+        return {
+            "queue_size": self._queue.qsize(),
+            "max_queue_size": self._queue.maxsize,
+            "workers": self.workers,
+            "running": statuses.count(RUNNING),
+            "done": statuses.count(DONE),
+            "failed": statuses.count(FAILED),
+        }
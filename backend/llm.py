@@ -1,29 +1,72 @@
-from typing import Dict, List
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Set, Tuple
 
+import asyncio
+import hashlib
 import textwrap
+import threading
 from abc import ABC, abstractmethod
-from collections import deque
-from datetime import datetime, timedelta
-import random
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+import re
 import time
 import httpx
 from loguru import logger
 
-from langchain_core.messages import BaseMessage, SystemMessage
+from langchain_core.messages import BaseMessage, BaseMessageChunk, HumanMessage, SystemMessage
+from langchain_core.messages.ai import UsageMetadata, add_usage
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import Runnable, RunnableConfig, RunnableLambda
 from google.genai import types
 
+import config
+import metrics
 import prompts
+from cache import analysis_cache_key, chunk_cache
+from chunking import chunk_text, pack, parse_tagged_findings, split_clauses, tag_clauses
+from fingerprints import clause_index
+from rate_limiter import estimate_tokens, get_rate_limiter
+from routing import Backend, LLMRouter
 
 
-def pause(low: int = 1, high: int = 2) -> None:
+def hash_api_key(api_key: str) -> str:
+    """Hash API key so it is never kept as a plain text dictionary key."""
+    return hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()
+
+
+def split_prompt(prompt) -> Tuple[List[BaseMessage], List[BaseMessage]]:
     """
-    Pause for a random amount of time between low and high seconds.
-    Used to simulate user behavior.
+    Split prompt into the static prefix (system role and instructions), which is the same
+    for every request and can be cached by providers, and the document which always goes last.
     """
-    pause = round(random.uniform(low, high), 1)
-    time.sleep(pause)
+    if hasattr(prompt, "to_messages"):
+        messages = prompt.to_messages()
+    else:
+        messages = [HumanMessage(content=str(prompt))]
+    return messages[:-1], messages[-1:]
+
+
+def prefix_tokens(prefix: List[BaseMessage]) -> int:
+    """Estimated size of the static prompt prefix, providers only cache prefixes above a minimum."""
+    return estimate_tokens("".join(str(m.content) for m in prefix))
+
+
+def prefix_key(prefix: List[BaseMessage]) -> str:
+    """Stable hash of the static prompt prefix."""
+    digest = hashlib.sha256()
+    for message in prefix:
+        digest.update(f"{message.type}:{message.content}\n".encode("utf-8"))
+    return digest.hexdigest()[:32]
+
+
+@dataclass(frozen=True)
+class FallbackModel:
+    """Backend to use when the main LLM provider fails or is slow"""
+
+    llm_provider: str
+    llm_model: str
+    api_key: str = ""
 
 
 class AIModel(ABC):
@@ -31,6 +74,14 @@ class AIModel(ABC):
     def invoke(self, prompt: str) -> str:
         pass
 
+    @abstractmethod
+    async def ainvoke(self, prompt: str) -> str:
+        pass
+
+    @abstractmethod
+    def astream(self, prompt: str) -> AsyncIterator[BaseMessageChunk]:
+        pass
+
 
 class GeminiModel(AIModel):
     """Get access to Gemini model"""
@@ -70,20 +121,125 @@ class GeminiModel(AIModel):
             model_kwargs["http_options"] = http_options
 
         self.model = ChatGoogleGenerativeAI(**model_kwargs)
+        self.llm_model = llm_model
+        self.llm_proxy = llm_proxy
+        self._client = None
+        # prefix key -> (cached content name or None if it can't be cached, expiry time)
+        self._cached_contents: Dict[str, Tuple[Optional[str], float]] = {}
+        self._cache_lock = asyncio.Lock()
         logger.debug("GeminiModel initialized successfully")
 
+    def _genai_client(self):
+        if self._client is None:
+            from google import genai
+
+            http_options = None
+            if self.llm_proxy:
+                http_options = types.HttpOptions(
+                    client_args={"proxy": self.llm_proxy},
+                    async_client_args={"proxy": self.llm_proxy},
+                )
+            self._client = genai.Client(api_key=self.google_api_key, http_options=http_options)
+        return self._client
+
+    def _cache_config(self, prefix: List[BaseMessage]) -> types.CreateCachedContentConfig:
+        system = "\n".join(m.content for m in prefix if isinstance(m, SystemMessage))
+        instructions = "\n".join(m.content for m in prefix if not isinstance(m, SystemMessage))
+        return types.CreateCachedContentConfig(
+            system_instruction=system or None,
+            contents=[types.Content(role="user", parts=[types.Part(text=instructions)])],
+            ttl=f"{config.GEMINI_CACHE_TTL}s",
+        )
+
+    def _lookup_cached_content(self, prefix: List[BaseMessage]) -> Tuple[str, Optional[str], bool]:
+        """Return prefix key, cached content name and whether the cached content must be created."""
+        key = prefix_key(prefix)
+        entry = self._cached_contents.get(key)
+        if entry is not None and entry[1] > time.time():
+            return key, entry[0], False
+        return key, None, prefix_tokens(prefix) >= config.GEMINI_CACHE_MIN_TOKENS
+
+    def _store_cached_content(self, key: str, name: Optional[str]) -> None:
+        # refresh the cache a minute before the provider drops it
+        expires_at = time.time() + max(config.GEMINI_CACHE_TTL - 60, 60)
+        self._cached_contents[key] = (name, expires_at)
+
+    def _prepare_messages(self, prompt, cached_content: Optional[str]) -> List[BaseMessage]:
+        prefix, document = split_prompt(prompt)
+        # the cached content already holds the system role and instructions
+        return document if cached_content else prefix + document
+
+    def _cached_content(self, prompt) -> Optional[str]:
+        prefix, _ = split_prompt(prompt)
+        key, name, create = self._lookup_cached_content(prefix)
+        if create:
+            try:
+                cache = self._genai_client().caches.create(
+                    model=self.llm_model, config=self._cache_config(prefix)
+                )
+                name = cache.name
+                logger.info(f"Created Gemini cached content for prompt prefix: {name}")
+            except Exception as e:
+                logger.warning(f"Gemini prompt prefix can't be cached: {str(e)}")
+            self._store_cached_content(key, name)
+        return name
+
+    async def _acached_content(self, prompt) -> Optional[str]:
+        prefix, _ = split_prompt(prompt)
+        key, name, create = self._lookup_cached_content(prefix)
+        if not create:
+            return name
+        async with self._cache_lock:
+            # concurrent requests wait for the first one to create the cache
+            key, name, create = self._lookup_cached_content(prefix)
+            if create:
+                try:
+                    cache = await self._genai_client().aio.caches.create(
+                        model=self.llm_model, config=self._cache_config(prefix)
+                    )
+                    name = cache.name
+                    logger.info(f"Created Gemini cached content for prompt prefix: {name}")
+                except Exception as e:
+                    logger.warning(f"Gemini prompt prefix can't be cached: {str(e)}")
+                self._store_cached_content(key, name)
+        return name
+
     def invoke(self, prompt: ChatPromptTemplate) -> BaseMessage:
         logger.debug("Invoking Gemini model")
-        prompt_messages = [SystemMessage(content=prompts.system_role)] + prompt.messages
-        # randomly select one proxy after another until LLM request succeeds
+        cached_content = self._cached_content(prompt)
+        prompt_messages = self._prepare_messages(prompt, cached_content)
         try:
-            response = self.model.invoke(prompt_messages)
+            response = self.model.invoke(prompt_messages, cached_content=cached_content)
             logger.debug("Gemini model invocation completed successfully")
             return response
         except Exception as e:
             logger.error(f"Gemini model invocation failed: {str(e)}", exc_info=True)
             raise
 
+    async def ainvoke(self, prompt: ChatPromptTemplate) -> BaseMessage:
+        logger.debug("Invoking Gemini model (async)")
+        cached_content = await self._acached_content(prompt)
+        prompt_messages = self._prepare_messages(prompt, cached_content)
+        try:
+            response = await self.model.ainvoke(prompt_messages, cached_content=cached_content)
+            logger.debug("Gemini model async invocation completed successfully")
+            return response
+        except Exception as e:
+            logger.error(f"Gemini model async invocation failed: {str(e)}", exc_info=True)
+            raise
+
+    async def astream(self, prompt: ChatPromptTemplate) -> AsyncIterator[BaseMessageChunk]:
+        logger.debug("Streaming Gemini model")
+        cached_content = await self._acached_content(prompt)
+        prompt_messages = self._prepare_messages(prompt, cached_content)
+        try:
+            async for chunk in self.model.astream(prompt_messages, cached_content=cached_content):
+                yield chunk
+            logger.debug("Gemini model streaming completed successfully")
+        except Exception as e:
+            logger.error(f"Gemini model streaming failed: {str(e)}", exc_info=True)
+            raise
+
 
 class OpenAIModel(AIModel):
     """Get access to OpenAI model"""
@@ -98,8 +254,10 @@ class OpenAIModel(AIModel):
         )
         if llm_proxy:
             http_client = httpx.Client(proxy=llm_proxy)
+            http_async_client = httpx.AsyncClient(proxy=llm_proxy)
         else:
             http_client = None
+            http_async_client = None
         self.llm_proxy = llm_proxy
         self.model_name = llm_model
         self.openai_api_key = api_key
@@ -110,6 +268,7 @@ class OpenAIModel(AIModel):
             model_name=self.model_name,
             openai_api_key=self.openai_api_key,
             http_client=http_client,
+            http_async_client=http_async_client,
             temperature=effective_temp,
             presence_penalty=0,
             frequency_penalty=0,
@@ -118,17 +277,52 @@ class OpenAIModel(AIModel):
         )
         logger.debug("OpenAIModel initialized successfully")
 
+    @staticmethod
+    def _prepare(prompt) -> Tuple[List[BaseMessage], Dict[str, str]]:
+        """
+        Prompts longer than 1024 tokens are cached by OpenAI automatically, prompt_cache_key
+        routes requests with the same static prefix to the same cache.
+        Below OPENAI_CACHE_MIN_TOKENS the prefix alone can't be cached, so no key is sent.
+        """
+        prefix, document = split_prompt(prompt)
+        kwargs = {}
+        if prefix_tokens(prefix) >= config.OPENAI_CACHE_MIN_TOKENS:
+            kwargs["prompt_cache_key"] = prefix_key(prefix)
+        return prefix + document, kwargs
+
     def invoke(self, prompt: ChatPromptTemplate) -> BaseMessage:
         logger.debug("Invoking OpenAI model")
-        prompt_messages = [SystemMessage(content=prompts.system_role)] + prompt.messages
+        prompt_messages, cache_kwargs = self._prepare(prompt)
         try:
-            response = self.model.invoke(prompt_messages)
+            response = self.model.invoke(prompt_messages, **cache_kwargs)
             logger.debug("OpenAI model invocation completed successfully")
             return response
         except Exception as e:
             logger.error(f"OpenAI model invocation failed: {str(e)}", exc_info=True)
             raise
 
+    async def ainvoke(self, prompt: ChatPromptTemplate) -> BaseMessage:
+        logger.debug("Invoking OpenAI model (async)")
+        prompt_messages, cache_kwargs = self._prepare(prompt)
+        try:
+            response = await self.model.ainvoke(prompt_messages, **cache_kwargs)
+            logger.debug("OpenAI model async invocation completed successfully")
+            return response
+        except Exception as e:
+            logger.error(f"OpenAI model async invocation failed: {str(e)}", exc_info=True)
+            raise
+
+    async def astream(self, prompt: ChatPromptTemplate) -> AsyncIterator[BaseMessageChunk]:
+        logger.debug("Streaming OpenAI model")
+        prompt_messages, cache_kwargs = self._prepare(prompt)
+        try:
+            async for chunk in self.model.astream(prompt_messages, **cache_kwargs):
+                yield chunk
+            logger.debug("OpenAI model streaming completed successfully")
+        except Exception as e:
+            logger.error(f"OpenAI model streaming failed: {str(e)}", exc_info=True)
+            raise
+
 
 class ClaudeModel(AIModel):
     """Get access to Claude model"""
@@ -140,16 +334,49 @@ class ClaudeModel(AIModel):
         self.model = ChatAnthropic(model=llm_model, api_key=api_key, temperature=temperature)
         logger.debug("ClaudeModel initialized successfully")
 
+    @staticmethod
+    def _prepare(prompt) -> List[BaseMessage]:
+        """
+        Mark the end of the static prefix with a cache breakpoint, the document goes after it.
+        Anthropic ignores breakpoints below its minimum cacheable length (CLAUDE_CACHE_MIN_TOKENS).
+        """
+        prefix, document = split_prompt(prompt)
+        if prefix and prefix_tokens(prefix) >= config.CLAUDE_CACHE_MIN_TOKENS:
+            last = prefix[-1]
+            block = {"type": "text", "text": last.content, "cache_control": {"type": "ephemeral"}}
+            prefix = prefix[:-1] + [last.__class__(content=[block])]
+        return prefix + document
+
     def invoke(self, prompt: str) -> BaseMessage:
         logger.debug("Invoking Claude model")
         try:
-            response = self.model.invoke(prompt)
+            response = self.model.invoke(self._prepare(prompt))
             logger.debug("Claude model invocation completed successfully")
             return response
         except Exception as e:
             logger.error(f"Claude model invocation failed: {str(e)}", exc_info=True)
             raise
 
+    async def ainvoke(self, prompt: str) -> BaseMessage:
+        logger.debug("Invoking Claude model (async)")
+        try:
+            response = await self.model.ainvoke(self._prepare(prompt))
+            logger.debug("Claude model async invocation completed successfully")
+            return response
+        except Exception as e:
+            logger.error(f"Claude model async invocation failed: {str(e)}", exc_info=True)
+            raise
+
+    async def astream(self, prompt: str) -> AsyncIterator[BaseMessageChunk]:
+        logger.debug("Streaming Claude model")
+        try:
+            async for chunk in self.model.astream(self._prepare(prompt)):
+                yield chunk
+            logger.debug("Claude model streaming completed successfully")
+        except Exception as e:
+            logger.error(f"Claude model streaming failed: {str(e)}", exc_info=True)
+            raise
+
 
 class OllamaModel(AIModel):
     """Get access to Ollama model"""
@@ -160,10 +387,13 @@ class OllamaModel(AIModel):
         logger.info(
             f"Initializing OllamaModel: model={llm_model}, api_url={llm_api_url if llm_api_url else 'default'}"
         )
+        # keep the model loaded, so its KV cache of the static prompt prefix is reused
         if len(llm_api_url) > 0:
-            self.model = ChatOllama(model=llm_model, base_url=llm_api_url)
+            self.model = ChatOllama(
+                model=llm_model, base_url=llm_api_url, keep_alive=config.OLLAMA_KEEP_ALIVE
+            )
         else:
-            self.model = ChatOllama(model=llm_model)
+            self.model = ChatOllama(model=llm_model, keep_alive=config.OLLAMA_KEEP_ALIVE)
         logger.debug("OllamaModel initialized successfully")
 
     def invoke(self, prompt: str) -> BaseMessage:
@@ -176,6 +406,26 @@ class OllamaModel(AIModel):
             logger.error(f"Ollama model invocation failed: {str(e)}", exc_info=True)
             raise
 
+    async def ainvoke(self, prompt: str) -> BaseMessage:
+        logger.debug("Invoking Ollama model (async)")
+        try:
+            response = await self.model.ainvoke(prompt)
+            logger.debug("Ollama model async invocation completed successfully")
+            return response
+        except Exception as e:
+            logger.error(f"Ollama model async invocation failed: {str(e)}", exc_info=True)
+            raise
+
+    async def astream(self, prompt: str) -> AsyncIterator[BaseMessageChunk]:
+        logger.debug("Streaming Ollama model")
+        try:
+            async for chunk in self.model.astream(prompt):
+                yield chunk
+            logger.debug("Ollama model streaming completed successfully")
+        except Exception as e:
+            logger.error(f"Ollama model streaming failed: {str(e)}", exc_info=True)
+            raise
+
 
 class AIAdapter:
     """Class for accessing LLM models from different companies via API"""
@@ -196,7 +446,9 @@ class AIAdapter:
         self.temperature = temperature
         self.free_tier = free_tier
         self.free_tier_rpm_limit = free_tier_rpm_limit
-        self.free_tier_request_queue = deque(maxlen=self.free_tier_rpm_limit)
+        self.rate_limiter = get_rate_limiter(
+            llm_provider, hash_api_key(api_key), free_tier_rpm_limit, config.FREE_TIER_TPM_LIMIT
+        )
         self.model = self._create_model(api_key, llm_proxy, llm_api_url)
 
     def _create_model(self, api_key: str, llm_proxy: str, llm_api_url: str) -> AIModel:
@@ -221,44 +473,137 @@ class AIAdapter:
                 return ClaudeModel(api_key, self.llm_model, self.temperature)
             elif provider_lower == "ollama":
                 return OllamaModel(self.llm_model, llm_api_url)
+            elif provider_lower == "fake" and config.ENABLE_FAKE_LLM:
+                # offline stand-in for benchmarks, see bench/fake_llm.py
+                from bench.fake_llm import FakeModel
+
+                return FakeModel(self.llm_model)
 
             logger.error(f"Unsupported model provider: {self.model_provider}")
             raise ValueError(f"Unsupported model type: {self.model_provider}")
 
-    def invoke(self, prompt: str) -> str:
+    @staticmethod
+    def _prompt_tokens(prompt) -> int:
+        text = prompt.to_string() if hasattr(prompt, "to_string") else str(prompt)
+        return estimate_tokens(text)
+
+    def _acquire_blocking(self, prompt) -> int:
+        """Wait for the free tier rate limiter, return estimated prompt tokens."""
+        estimated_tokens = self._prompt_tokens(prompt)
         if self.free_tier:
-            if len(self.free_tier_request_queue) >= self.free_tier_rpm_limit:
-                first_request_timestamp = self.free_tier_request_queue.popleft()
-                time_delta = datetime.now() - first_request_timestamp
-                if time_delta < timedelta(seconds=60):
-                    wait_time = 60 - time_delta.total_seconds()
-                    logger.info(
-                        f"Rate limit reached ({self.free_tier_rpm_limit} requests). Waiting {wait_time:.1f}s before next request"
-                    )
-                    pause(wait_time, wait_time + 1)
-            self.free_tier_request_queue.append(datetime.now())
-            logger.debug(
-                f"Free tier request queue: {len(self.free_tier_request_queue)}/{self.free_tier_rpm_limit} requests in current window"
-            )
+            waited = self.rate_limiter.acquire_blocking(estimated_tokens)
+            metrics.rate_limiter_wait.inc(waited, provider=self.model_provider)
+        return estimated_tokens
+
+    async def _acquire(self, prompt) -> int:
+        """Wait for the free tier rate limiter without blocking the loop, return estimated prompt tokens."""
+        estimated_tokens = self._prompt_tokens(prompt)
+        if self.free_tier:
+            waited = await self.rate_limiter.acquire(estimated_tokens)
+            metrics.rate_limiter_wait.inc(waited, provider=self.model_provider)
+        return estimated_tokens
+
+    def _record_usage_metrics(self, usage: Optional[UsageMetadata]) -> Optional[int]:
+        """Record token usage metrics, return the input tokens reported by the provider."""
+        if usage:
+            details = usage.get("input_token_details") or {}
+            tokens = {
+                "input": usage.get("input_tokens", 0),
+                "output": usage.get("output_tokens", 0),
+                # prompt prefix tokens read from or written to the provider cache
+                "cache_read": details.get("cache_read") or 0,
+                "cache_creation": details.get("cache_creation") or 0,
+            }
+            for direction, count in tokens.items():
+                metrics.llm_tokens.inc(
+                    count, provider=self.model_provider, model=self.llm_model, direction=direction
+                )
+            metrics.add_request_usage(tokens)
+            if tokens["cache_read"]:
+                logger.debug(
+                    f"{tokens['cache_read']} of {tokens['input']} input tokens read from cache"
+                )
+        return usage.get("input_tokens") if usage else None
+
+    def _record_usage(self, estimated_tokens: int, usage: Optional[UsageMetadata]) -> None:
+        used_tokens = self._record_usage_metrics(usage)
+        if self.free_tier:
+            self.rate_limiter.record_usage(estimated_tokens, used_tokens)
+
+    async def _arecord_usage(self, estimated_tokens: int, usage: Optional[UsageMetadata]) -> None:
+        used_tokens = self._record_usage_metrics(usage)
+        if self.free_tier:
+            await self.rate_limiter.arecord_usage(estimated_tokens, used_tokens)
+
+    def _timed(self):
+        return metrics.timed("llm", provider=self.model_provider, model=self.llm_model)
+
+    def invoke(self, prompt: str) -> str:
+        estimated_tokens = self._acquire_blocking(prompt)
 
         logger.debug(f"Invoking AIAdapter with {self.model_provider} model")
         try:
-            response = self.model.invoke(prompt)
+            with self._timed():
+                response = self.model.invoke(prompt)
             logger.debug("AIAdapter invocation completed successfully")
+            self._record_usage(estimated_tokens, getattr(response, "usage_metadata", None))
             return response
         except Exception as e:
             logger.error(f"AIAdapter invocation failed: {str(e)}", exc_info=True)
+            metrics.count_error("llm", e)
+            raise
+
+    async def ainvoke(self, prompt: str) -> str:
+        estimated_tokens = await self._acquire(prompt)
+
+        logger.debug(f"Invoking AIAdapter with {self.model_provider} model (async)")
+        try:
+            with self._timed():
+                response = await self.model.ainvoke(prompt)
+            logger.debug("AIAdapter async invocation completed successfully")
+            await self._arecord_usage(estimated_tokens, getattr(response, "usage_metadata", None))
+            return response
+        except Exception as e:
+            logger.error(f"AIAdapter async invocation failed: {str(e)}", exc_info=True)
+            metrics.count_error("llm", e)
             raise
 
+    async def astream(self, prompt: str) -> AsyncIterator[BaseMessageChunk]:
+        estimated_tokens = await self._acquire(prompt)
+
+        logger.debug(f"Streaming AIAdapter with {self.model_provider} model")
+        usage = None
+        started = time.perf_counter()
+        first_token = True
+        try:
+            with self._timed():
+                async for chunk in self.model.astream(prompt):
+                    if first_token:
+                        first_token = False
+                        metrics.llm_time_to_first_token.observe(
+                            time.perf_counter() - started,
+                            provider=self.model_provider,
+                            model=self.llm_model,
+                        )
+                    if getattr(chunk, "usage_metadata", None):
+                        usage = add_usage(usage, chunk.usage_metadata)
+                    yield chunk
+            logger.debug("AIAdapter streaming completed successfully")
+            await self._arecord_usage(estimated_tokens, usage)
+        except Exception as e:
+            logger.error(f"AIAdapter streaming failed: {str(e)}", exc_info=True)
+            metrics.count_error("llm", e)
+            raise
 
-class LoggerChatModel:
+
+class LoggerChatModel(Runnable):
     """
     Class for interacting with language model (LLM) and logging all operations.
     This class processes requests to the language model, parses and logs responses, and handles
     possible errors such as rate limit exceeded or network errors.
     """
 
-    def __init__(self, llm: GeminiModel):
+    def __init__(self, llm: LLMRouter):
         self.llm = llm
 
     def __call__(self, messages: List[Dict[str, str]]) -> str:
@@ -268,6 +613,30 @@ class LoggerChatModel:
         reply = self.llm.invoke(messages)
         return reply
 
+    async def acall(self, messages: List[Dict[str, str]]) -> str:
+        """
+        Async version of __call__, used when the chain is run with ainvoke.
+        """
+        reply = await self.llm.ainvoke(messages)
+        return reply
+
+    def invoke(self, input, config: Optional[RunnableConfig] = None, **kwargs) -> BaseMessage:
+        return self(input)
+
+    async def ainvoke(
+        self, input, config: Optional[RunnableConfig] = None, **kwargs
+    ) -> BaseMessage:
+        return await self.acall(input)
+
+    async def astream(
+        self, input, config: Optional[RunnableConfig] = None, **kwargs
+    ) -> AsyncIterator[BaseMessageChunk]:
+        """
+        Stream reply chunks, used when the chain is run with astream.
+        """
+        async for chunk in self.llm.astream(input):
+            yield chunk
+
 
 class GPTAnswerer:
     """
@@ -287,14 +656,39 @@ class GPTAnswerer:
         temperature: float,
         free_tier: bool,
         free_tier_rpm_limit: int,
+        fallbacks: Sequence[FallbackModel] = (),
+        hedge: bool = False,
     ):
         self.job = None
         self.ai_adapter = AIAdapter(
             api_key, llm_proxy, llm_provider, llm_model, temperature, free_tier, free_tier_rpm_limit
         )
-        self.llm_cheap = LoggerChatModel(self.ai_adapter)
+        backends = [
+            Backend(self.ai_adapter, (llm_provider.lower(), llm_model, hash_api_key(api_key)))
+        ]
+        for fallback in fallbacks:
+            fallback_key = fallback.api_key or api_key
+            adapter = AIAdapter(
+                fallback_key,
+                llm_proxy,
+                fallback.llm_provider,
+                fallback.llm_model,
+                temperature,
+                free_tier,
+                free_tier_rpm_limit,
+            )
+            key = (fallback.llm_provider.lower(), fallback.llm_model, hash_api_key(fallback_key))
+            backends.append(Backend(adapter, key))
+        self.router = LLMRouter(backends, hedge=hedge)
+        # answers of a fallback model must not be cached as answers of the main model
+        self.fallback_models = tuple((f.llm_provider, f.llm_model) for f in fallbacks)
+        self.llm_cheap = LoggerChatModel(self.router)
         self.chains = {
             "analyze_agreement": self._create_chain(prompts.analyze_agreement_prompt),
+            "analyze_chunk": self._create_chain(prompts.analyze_chunk_prompt),
+            "merge_analyses": self._create_chain(prompts.merge_analyses_prompt),
+            "analyze_clauses": self._create_chain(prompts.analyze_clauses_prompt),
+            "merge_incremental": self._create_chain(prompts.merge_incremental_prompt),
         }
 
     @staticmethod
@@ -302,11 +696,37 @@ class GPTAnswerer:
         """Transform template string for use in prompts."""
         return textwrap.dedent(template)
 
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def _compile_prompt(template: str) -> ChatPromptTemplate:
+        """
+        Compile prompt template once and share it between all answerers.
+        The system role and instructions go first and the document last, so the prefix
+        of every request is the same and providers can cache it.
+        """
+        template = GPTAnswerer._preprocess_template_string(template).strip()
+        # the document part starts at the paragraph with the first variable
+        first_variable = re.search(r"(?<!\{)\{\w+\}", template).start()
+        split_at = template.rfind("\n\n", 0, first_variable)
+        instructions, document = template[:split_at], template[split_at:].strip()
+        return ChatPromptTemplate.from_messages(
+            [("system", prompts.system_role.strip()), ("human", instructions), ("human", document)]
+        )
+
     def _create_chain(self, template: str) -> ChatPromptTemplate:
         """Create a chain for a specific resume section."""
-        template = self._preprocess_template_string(template)
-        prompt = ChatPromptTemplate.from_template(template)
-        return prompt | self.llm_cheap | StrOutputParser()
+        prompt = self._compile_prompt(template)
+
+        def build_prompt(inputs: Dict[str, str]):
+            with metrics.timed("prompt_build"):
+                return prompt.invoke(inputs)
+
+        async def abuild_prompt(inputs: Dict[str, str]):
+            return build_prompt(inputs)
+
+        return (
+            RunnableLambda(build_prompt, afunc=abuild_prompt) | self.llm_cheap | StrOutputParser()
+        )
 
     def analyze_agreement(self, text: str) -> str:
         """
@@ -321,3 +741,355 @@ class GPTAnswerer:
         except Exception as e:
             logger.error(f"Agreement analysis failed: {str(e)}", exc_info=True)
             raise
+
+    async def aanalyze_agreement(self, text: str) -> str:
+        """
+        Analyze agreement without blocking the event loop.
+        Long agreements are split into chunks (or clauses, see _amap) which are analysed
+        concurrently and then merged.
+        """
+        if estimate_tokens(text) > config.CHUNK_THRESHOLD_TOKENS:
+            return await self._aanalyze_long_agreement(text)
+
+        logger.info(f"Starting async agreement analysis: {len(text)} characters")
+        chain = self.chains["analyze_agreement"]
+        try:
+            output = await chain.ainvoke({"text": text})
+            logger.info(f"Agreement analysis completed: {len(output)} characters in response")
+            return output
+        except Exception as e:
+            logger.error(f"Agreement analysis failed: {str(e)}", exc_info=True)
+            raise
+
+    def _cache_key(self, text: str, template: str) -> str:
+        return analysis_cache_key(
+            text,
+            self.ai_adapter.model_provider,
+            self.ai_adapter.llm_model,
+            self.ai_adapter.temperature,
+            template,
+            self.fallback_models,
+        )
+
+    async def _aanalyze_chunk(
+        self, chunk: str, part: int, total: int, semaphore: asyncio.Semaphore
+    ) -> str:
+        """Find red flags in one chunk, reusing cached result if this chunk was seen before."""
+        cache_key = self._cache_key(chunk, prompts.analyze_chunk_prompt)
+        cached = await chunk_cache.aget(cache_key)
+        if cached is not None:
+            logger.debug(f"Using cached analysis of chunk {part}/{total}")
+            return cached
+        async with semaphore:
+            output = await self.chains["analyze_chunk"].ainvoke(
+                {"text": chunk, "part": part, "total": total}
+            )
+        await chunk_cache.aset(cache_key, output)
+        return output
+
+    async def _areduce_analyses(self, analyses: List[str]) -> str:
+        """
+        Merge partial analyses in groups until they fit into one request.
+        Return the text for the final merge request.
+        """
+        analyses = [analysis.strip() for analysis in analyses if analysis.strip()]
+        while (
+            len(analyses) > 1
+            and estimate_tokens("\n\n".join(analyses)) > config.CHUNK_THRESHOLD_TOKENS
+        ):
+            groups = pack(analyses, config.CHUNK_THRESHOLD_TOKENS)
+            if len(groups) == len(analyses):
+                break
+            logger.info(f"Merging {len(analyses)} partial analyses in {len(groups)} groups")
+            analyses = await asyncio.gather(
+                *(self.chains["merge_analyses"].ainvoke({"text": group}) for group in groups)
+            )
+        return "\n\n".join(analyses)
+
+    async def _amap_chunks(self, text: str) -> List[str]:
+        """Analyse chunks of a long agreement concurrently."""
+        chunks = chunk_text(text, config.CHUNK_MAX_TOKENS)
+        logger.info(
+            f"Starting chunked agreement analysis: {len(text)} characters, {len(chunks)} chunks"
+        )
+        semaphore = asyncio.Semaphore(config.CHUNK_CONCURRENCY)
+        return await asyncio.gather(
+            *(
+                self._aanalyze_chunk(chunk, i + 1, len(chunks), semaphore)
+                for i, chunk in enumerate(chunks)
+            )
+        )
+
+    async def _amap(self, text: str) -> List[str]:
+        """
+        Partial analyses of a long agreement. With the clause index on, agreements with many
+        clauses are analysed clause by clause, reusing findings of clauses seen before.
+        """
+        if config.CLAUSE_INDEX:
+            clauses = split_clauses(text)
+            if len(clauses) >= config.CLAUSE_INDEX_MIN_CLAUSES:
+                findings, _ = await self.aanalyze_clauses(dict(enumerate(clauses)))
+                return [findings[i] for i in sorted(findings)]
+        return await self._amap_chunks(text)
+
+    async def _aanalyze_long_agreement(self, text: str) -> str:
+        try:
+            analyses = await self._amap(text)
+            merged = await self._areduce_analyses(analyses)
+            output = await self.chains["merge_analyses"].ainvoke({"text": merged})
+            logger.info(f"Agreement analysis completed: {len(output)} characters in response")
+            return output
+        except Exception as e:
+            logger.error(f"Chunked agreement analysis failed: {str(e)}", exc_info=True)
+            raise
+
+    def _index_namespace(self) -> str:
+        """Findings in the clause index are only reused for the same model and prompt."""
+        return self._cache_key("", prompts.analyze_clauses_prompt)
+
+    async def aanalyze_clauses(
+        self, clauses: Dict[int, str]
+    ) -> Tuple[Dict[int, str], List[List[int]]]:
+        """
+        Find red flags in the given clauses (clause ID -> text).
+        Clauses known to the clause index are answered from it, only novel ones go to the LLM.
+        Return findings per clause ID, clauses without red flags are left out, and groups of
+        clause IDs whose findings can't be attributed to single clauses (the model didn't tag
+        them), the findings of a group are only valid for the group as a whole.
+        """
+        known: Dict[int, str] = {}
+        fingerprints = {}
+        if config.CLAUSE_INDEX and clauses:
+            known, fingerprints = await clause_index.alookup(self._index_namespace(), clauses)
+        novel = {i: clause for i, clause in clauses.items() if i not in known}
+
+        batches = pack(tag_clauses(novel), config.CHUNK_MAX_TOKENS)
+        logger.info(
+            f"Analysing {len(novel)} clauses in {len(batches)} requests, "
+            f"{len(known)} clauses answered from the clause index"
+        )
+        semaphore = asyncio.Semaphore(config.CHUNK_CONCURRENCY)
+
+        async def analyze_batch(batch: str, clause_ids: List[int]) -> Tuple[Dict[int, str], bool]:
+            async with semaphore:
+                output = await self.chains["analyze_clauses"].ainvoke({"text": batch})
+            return parse_tagged_findings(output, clause_ids) if output.strip() else ({}, True)
+
+        # parts of an oversized clause split between batches belong to the clause before them
+        batch_ids = []
+        last_id = next(iter(novel), 0)
+        for batch in batches:
+            ids = [int(i) for i in re.findall(r"^\[C(\d+)\] ", batch, re.MULTILINE)] or [last_id]
+            last_id = ids[-1]
+            batch_ids.append(ids)
+
+        findings: Dict[int, str] = {}
+        # findings of clauses in a reply with untagged bullets may belong to other clauses
+        groups: List[Set[int]] = []
+        results = await asyncio.gather(*(analyze_batch(*args) for args in zip(batches, batch_ids)))
+        for ids, (batch_findings, tagged) in zip(batch_ids, results):
+            if not tagged:
+                group = set(ids)
+                # an oversized clause split between batches joins their groups
+                for other in [other for other in groups if other & group]:
+                    groups.remove(other)
+                    group |= other
+                groups.append(group)
+            for clause_id, clause_findings in batch_findings.items():
+                findings[clause_id] = "\n".join(
+                    filter(None, [findings.get(clause_id), clause_findings])
+                )
+
+        unreliable = set().union(*groups)
+        indexed = [i for i in novel if i not in unreliable]
+        if unreliable:
+            logger.warning(f"{len(unreliable)} clauses have findings the model didn't tag")
+        if fingerprints and indexed:
+            await clause_index.aadd(
+                self._index_namespace(), [(fingerprints[i], findings.get(i, "")) for i in indexed]
+            )
+        findings.update(
+            {i: clause_findings for i, clause_findings in known.items() if clause_findings}
+        )
+        return findings, [sorted(group) for group in groups]
+
+    async def amerge_findings(self, findings: List[str], changes: str) -> str:
+        """Merge clause findings into the final analysis with the "what changed" section."""
+        merged = await self._areduce_analyses(findings)
+        try:
+            output = await self.chains["merge_incremental"].ainvoke(
+                {"text": merged, "changes": changes}
+            )
+            logger.info(f"Incremental analysis completed: {len(output)} characters in response")
+            return output
+        except Exception as e:
+            logger.error(f"Merging clause findings failed: {str(e)}", exc_info=True)
+            raise
+
+    async def astream_agreement(self, text: str) -> AsyncIterator[str]:
+        """
+        Analyze agreement and stream the answer token by token.
+        For long agreements chunks are analysed first and only the final merge is streamed.
+        """
+        logger.info(f"Starting streamed agreement analysis: {len(text)} characters")
+        try:
+            if estimate_tokens(text) > config.CHUNK_THRESHOLD_TOKENS:
+                analyses = await self._amap(text)
+                merged = await self._areduce_analyses(analyses)
+                chain = self.chains["merge_analyses"]
+                inputs = {"text": merged}
+            else:
+                chain = self.chains["analyze_agreement"]
+                inputs = {"text": text}
+            length = 0
+            async for token in chain.astream(inputs):
+                length += len(token)
+                yield token
+            logger.info(f"Agreement analysis completed: {length} characters in response")
+        except Exception as e:
+            logger.error(f"Streamed agreement analysis failed: {str(e)}", exc_info=True)
+            raise
+
+
+class AnswererRegistry:
+    """
+    Process-wide LRU pool of GPTAnswerer instances.
+    Reusing answerers keeps LLM clients (and their warm HTTP connection pools)
+    and compiled chains alive between requests instead of rebuilding them every time.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._answerers: "OrderedDict[Tuple, Tuple[GPTAnswerer, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(
+        llm_provider: str,
+        llm_model: str,
+        temperature: float,
+        llm_proxy: str,
+        api_key: str,
+        free_tier: bool,
+        free_tier_rpm_limit: int,
+        fallbacks: Sequence[FallbackModel] = (),
+        hedge: bool = False,
+    ) -> Tuple:
+        return (
+            llm_provider.lower(),
+            llm_model,
+            float(temperature),
+            llm_proxy or "",
+            hash_api_key(api_key),
+            free_tier,
+            free_tier_rpm_limit,
+            tuple(
+                (fallback.llm_provider.lower(), fallback.llm_model, hash_api_key(fallback.api_key))
+                for fallback in fallbacks
+            ),
+            hedge,
+        )
+
+    def _evict_expired(self, now: float) -> None:
+        expired = [key for key, (_, created) in self._answerers.items() if now - created > self.ttl]
+        for key in expired:
+            del self._answerers[key]
+        if expired:
+            logger.debug(f"Evicted {len(expired)} expired answerers from the pool")
+
+    def get(
+        self,
+        api_key: str,
+        llm_proxy: str,
+        llm_provider: str,
+        llm_model: str,
+        temperature: float,
+        free_tier: bool,
+        free_tier_rpm_limit: int,
+        fallbacks: Sequence[FallbackModel] = (),
+        hedge: bool = False,
+    ) -> "GPTAnswerer":
+        """Return pooled answerer for the given settings, creating it if needed."""
+        key = self.make_key(
+            llm_provider,
+            llm_model,
+            temperature,
+            llm_proxy,
+            api_key,
+            free_tier,
+            free_tier_rpm_limit,
+            fallbacks,
+            hedge,
+        )
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            entry = self._answerers.get(key)
+            if entry is not None:
+                self._answerers.move_to_end(key)
+                self.hits += 1
+                logger.debug(f"Reusing pooled answerer: provider={llm_provider}, model={llm_model}")
+                return entry[0]
+            self.misses += 1
+
+        answerer = GPTAnswerer(
+            api_key=api_key,
+            llm_proxy=llm_proxy,
+            llm_provider=llm_provider,
+            llm_model=llm_model,
+            temperature=temperature,
+            free_tier=free_tier,
+            free_tier_rpm_limit=free_tier_rpm_limit,
+            fallbacks=fallbacks,
+            hedge=hedge,
+        )
+        with self._lock:
+            # another request could have created the same answerer meanwhile
+            entry = self._answerers.get(key)
+            if entry is not None:
+                self._answerers.move_to_end(key)
+                return entry[0]
+            self._answerers[key] = (answerer, now)
+            while len(self._answerers) > self.max_size:
+                self._answerers.popitem(last=False)
+                logger.debug("Answerer pool is full, evicted least recently used answerer")
+        return answerer
+
+    def clear(self) -> None:
+        with self._lock:
+            self._answerers.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"size": len(self._answerers), "hits": self.hits, "misses": self.misses}
+
+
+answerer_registry = AnswererRegistry(config.ANSWERER_POOL_SIZE, config.ANSWERER_POOL_TTL)
+
+
+def get_answerer(
+    api_key: str,
+    llm_proxy: str,
+    llm_provider: str,
+    llm_model: str,
+    temperature: float,
+    free_tier: bool,
+    free_tier_rpm_limit: int,
+    fallbacks: Sequence[FallbackModel] = (),
+    hedge: bool = False,
+) -> GPTAnswerer:
+    """Get GPTAnswerer from the process-wide pool."""
+    return answerer_registry.get(
+        api_key,
+        llm_proxy,
+        llm_provider,
+        llm_model,
+        temperature,
+        free_tier,
+        free_tier_rpm_limit,
+        fallbacks,
+        hedge,
+    )
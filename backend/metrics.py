@@ -0,0 +1,264 @@
+"""
+Minimal Prometheus-compatible metrics: counters, gauges and histograms with labels,
+rendered in the Prometheus text exposition format on /metrics.
+
+Stage timings are also collected per request to be sent in the Server-Timing header.
+"""
+
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# (name, duration in seconds) of the stages of the current request
+_request_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar(
+    "request_timings", default=None
+)
+
+# LLM token usage of the current request, by direction (input, output, cache_read, cache_creation)
+_request_usage: ContextVar[Optional[Dict[str, int]]] = ContextVar("request_usage", default=None)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _samples(self) -> Iterator[Tuple[str, Dict[str, str], float]]:
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for name, labels, value in self._samples():
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set_total(self, value: float, **labels: str) -> None:
+        """Set the counter from a total counted somewhere else (used by collectors)."""
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._histograms: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            # bucket counts, then sum and count
+            histogram = self._histograms.setdefault(key, [0] * (len(self.buckets) + 2))
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                histogram[index] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def _samples(self) -> Iterator[Tuple[str, Dict[str, str], float]]:
+        with self._lock:
+            histograms = [(key, list(values)) for key, values in self._histograms.items()]
+        for key, values in histograms:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                bucket_labels = {**labels, "le": _format_value(float(bound))}
+                yield f"{self.name}_bucket", bucket_labels, cumulative
+            yield f"{self.name}_bucket", {**labels, "le": "+Inf"}, values[-1]
+            yield f"{self.name}_sum", labels, values[-2]
+            yield f"{self.name}_count", labels, values[-1]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[Metric] = []
+        self._collectors: List[Callable[[], None]] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector: Callable[[], None]) -> None:
+        """Collector updates metrics from other components' stats right before rendering."""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in self._collectors:
+            collector()
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+
+registry = Registry()
+
+stage_duration = registry.register(
+    Histogram(
+        "agreement_stage_duration_seconds",
+        "Duration of pipeline stages (scrape, html_extract, pdf_extract, compact, clause_lookup, prompt_build, llm).",
+        ["stage", "provider", "model"],
+    )
+)
+llm_time_to_first_token = registry.register(
+    Histogram(
+        "agreement_llm_time_to_first_token_seconds",
+        "Time until the first streamed token of LLM response.",
+        ["provider", "model"],
+    )
+)
+llm_tokens = registry.register(
+    Counter(
+        "agreement_llm_tokens_total",
+        "LLM tokens reported by providers.",
+        ["provider", "model", "direction"],
+    )
+)
+rate_limiter_wait = registry.register(
+    Counter(
+        "agreement_rate_limiter_wait_seconds_total",
+        "Time spent waiting for the free tier rate limiter.",
+        ["provider"],
+    )
+)
+llm_failovers = registry.register(
+    Counter(
+        "agreement_llm_failovers_total",
+        "LLM retries, failovers to the next backend and hedged requests.",
+        ["provider", "reason"],
+    )
+)
+llm_circuit_open = registry.register(
+    Gauge(
+        "agreement_llm_circuit_open",
+        "1 if the circuit breaker of LLM backend is open.",
+        ["backend"],
+    )
+)
+errors = registry.register(
+    Counter("agreement_errors_total", "Errors by stage and exception type.", ["stage", "type"])
+)
+cache_requests = registry.register(
+    Counter("agreement_cache_requests_total", "Cache lookups by result.", ["cache", "result"])
+)
+in_flight_requests = registry.register(
+    Gauge("agreement_in_flight_requests", "HTTP requests being processed.")
+)
+browser_pool_pages = registry.register(
+    Gauge("agreement_browser_pool_pages", "Browser pool pages by state.", ["state"])
+)
+job_queue_jobs = registry.register(
+    Gauge("agreement_job_queue_jobs", "Background jobs by state.", ["state"])
+)
+clause_index_entries = registry.register(
+    Gauge("agreement_clause_index_entries", "Clause fingerprints in the clause index.")
+)
+
+
+@contextmanager
+def timed(stage: str, provider: str = "", model: str = "") -> Iterator[None]:
+    """Measure a stage, record it in the histogram and in the current request timings."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - started
+        stage_duration.observe(duration, stage=stage, provider=provider, model=model)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((stage, duration))
+
+
+def count_error(stage: str, error: BaseException) -> None:
+    errors.inc(stage=stage, type=type(error).__name__)
+
+
+def start_request_timings() -> List[Tuple[str, float]]:
+    timings: List[Tuple[str, float]] = []
+    _request_timings.set(timings)
+    return timings
+
+
+def start_request_usage() -> Dict[str, int]:
+    usage: Dict[str, int] = {}
+    _request_usage.set(usage)
+    return usage
+
+
+def add_request_usage(tokens: Dict[str, int]) -> None:
+    usage = _request_usage.get()
+    if usage is not None:
+        for direction, count in tokens.items():
+            usage[direction] = usage.get(direction, 0) + count
+
+
+def server_timing_header(timings: List[Tuple[str, float]]) -> str:
+    """Format stage timings for the Server-Timing header, repeated stages are summed."""
+    totals: Dict[str, float] = {}
+    for stage, duration in timings:
+        totals[stage] = totals.get(stage, 0) + duration
+    return ", ".join(f"{stage};dur={duration * 1000:.1f}" for stage, duration in totals.items())
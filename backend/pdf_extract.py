@@ -0,0 +1,89 @@
+"""
+PDF text extraction in a process pool.
+
+Pages are split into ranges which are extracted in parallel by worker processes,
+so large documents don't block the event loop. This module only depends on pypdf
+to keep worker start-up cheap.
+"""
+
+from typing import List, Optional, Union
+
+import asyncio
+import io
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pypdf import PdfReader
+
+# PDF is passed to workers either as bytes (small files) or as a path to a temp file
+PdfSource = Union[bytes, str]
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+class PdfTooLargeError(ValueError):
+    pass
+
+
+def _open(source: PdfSource) -> PdfReader:
+    if isinstance(source, bytes):
+        return PdfReader(io.BytesIO(source))
+    return PdfReader(source)
+
+
+def count_pages(source: PdfSource) -> int:
+    return len(_open(source).pages)
+
+
+def extract_pages(source: PdfSource, start: int, stop: int) -> List[str]:
+    """Extract text of pages [start, stop)."""
+    reader = _open(source)
+    return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+def get_executor(max_workers: int) -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+        )
+    return _executor
+
+
+def shutdown_executor(wait: bool = False) -> None:
+    """Stop the worker pool, wait=True joins the worker processes and blocks."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=wait, cancel_futures=True)
+        _executor = None
+
+
+async def extract_pdf_text(
+    source: PdfSource, max_pages: int, max_workers: int, pages_per_task: int
+) -> str:
+    """Extract text of the whole PDF in worker processes and join pages once."""
+    loop = asyncio.get_running_loop()
+    executor = get_executor(max_workers)
+    try:
+        num_pages = await loop.run_in_executor(executor, count_pages, source)
+    except BrokenProcessPool:
+        # a worker died (e.g. out of memory), start a new pool for the next documents
+        shutdown_executor()
+        raise
+    if max_pages and num_pages > max_pages:
+        raise PdfTooLargeError(f"PDF has {num_pages} pages, limit is {max_pages}")
+
+    task_size = max(pages_per_task, -(-num_pages // max_workers))
+    tasks = [
+        loop.run_in_executor(
+            executor, extract_pages, source, start, min(start + task_size, num_pages)
+        )
+        for start in range(0, num_pages, task_size)
+    ]
+    try:
+        batches = await asyncio.gather(*tasks)
+    except BrokenProcessPool:
+        shutdown_executor()
+        raise
+    page_texts = [text for batch in batches for text in batch]
+    return "".join(text + "\n" for text in page_texts)
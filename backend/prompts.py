@@ -37,3 +37,107 @@ If language is Russian, use these headers:
 TEXT TO ANALYZE:
 {text}
 """
+
+analyze_chunk_prompt = """
+The text below is one part of a longer agreement. Analyze ONLY this part for "red flags"—clauses that pose significant risk, liability, or unfair burden to the signing party.
+
+### Analysis Guidelines:
+1. **Identify Risks:** Look for hidden fees, automatic renewals, non-competes, unbalanced indemnification, strict penalties, and unilateral termination rights.
+2. **Severity:** Mark every red flag as High, Medium or Low risk.
+3. **Evidence:** You MUST quote the specific snippet of text that contains the red flag.
+4. **Location:** Cite the clause number/section if available.
+
+### Output Rules:
+1. Write in the language of the input text.
+2. Output only a Markdown bullet list of red flags, one bullet per flag: severity, short explanation, quote, location.
+3. If this part contains no red flags, output an empty response.
+
+TEXT TO ANALYZE (part {part} of {total}):
+{text}
+"""
+
+merge_analyses_prompt = """
+Below are red flag lists produced for consecutive parts of one agreement. Merge them into a single analysis of the whole agreement.
+
+### Merge Guidelines:
+1. **Deduplicate:** Combine red flags that describe the same clause or the same risk.
+2. **Re-rank:** Sort red flags by severity across the whole agreement (High Risk -> Medium Risk), move Low risk items to minor concerns.
+3. **Evidence:** Keep the original quotes and clause/section references, do not invent new ones.
+
+### Language & Formatting Rules (CRITICAL):
+1. **Unified Language Output:** The **ENTIRE** response must be in the language of the red flag lists, including the section headers.
+2. **Markdown Format:** Use bullet points and bold text.
+
+### Structure of the Output:
+Do not use English headers unless the lists are in English. 
+If the lists are empty, just write that no red flags were found in that language.
+Else, translate the following concepts into that language and use them as headers:
+
+Headers and their descpriction:
+- **1.Executive Summary**: A 1-sentence overview of risk.
+- **2.Critical Red Flags**: The most dangerous clauses.
+- **3.Minor Concerns**: Lower priority risks.
+
+If language is Russian, use these headers:
+- **1. Резюме**
+- **2. Красные флаги**
+- **3. Незначительные замечания**
+
+RED FLAG LISTS:
+{text}
+"""
+
+analyze_clauses_prompt = """
+Analyze the clauses of an agreement below for "red flags"—clauses that pose significant risk, liability, or unfair burden to the signing party.
+Every clause starts with its ID in square brackets, for example [C12].
+
+### Analysis Guidelines:
+1. **Identify Risks:** Look for hidden fees, automatic renewals, non-competes, unbalanced indemnification, strict penalties, and unilateral termination rights.
+2. **Severity:** Mark every red flag as High, Medium or Low risk.
+3. **Evidence:** You MUST quote the specific snippet of text that contains the red flag.
+4. **Location:** Cite the clause number/section if available.
+
+### Output Rules:
+1. Write in the language of the input text.
+2. Output only a Markdown bullet list of red flags, one bullet per flag. Start every bullet with the ID of the clause it refers to, then severity, short explanation, quote, location, for example: "- [C12] High: ...".
+3. If the clauses contain no red flags, output an empty response.
+
+CLAUSES TO ANALYZE:
+{text}
+"""
+
+merge_incremental_prompt = """
+Below are red flag lists for the clauses of the current version of an agreement, and a list of clauses changed since its previous version. Merge the red flags into a single analysis of the whole agreement and explain what changed.
+
+### Merge Guidelines:
+1. **Deduplicate:** Combine red flags that describe the same clause or the same risk.
+2. **Re-rank:** Sort red flags by severity across the whole agreement (High Risk -> Medium Risk), move Low risk items to minor concerns.
+3. **Evidence:** Keep the original quotes and clause/section references, do not invent new ones.
+4. **Changes:** Describe how the added, modified and removed clauses change the risk for the signing party. If this is the first analysed version, just say so.
+
+### Language & Formatting Rules (CRITICAL):
+1. **Unified Language Output:** The **ENTIRE** response must be in the language of the red flag lists and clauses, including the section headers.
+2. **Markdown Format:** Use bullet points and bold text.
+
+### Structure of the Output:
+Do not use English headers unless the agreement is in English. 
+Translate the following concepts into that language and use them as headers:
+
+Headers and their descpriction:
+- **1.Executive Summary**: A 1-sentence overview of risk.
+- **2.Critical Red Flags**: The most dangerous clauses.
+- **3.Minor Concerns**: Lower priority risks.
+- **4.What Changed**: Changes since the previous version and their effect on risk.
+
+If language is Russian, use these headers:
+- **1. Резюме**
+- **2. Красные флаги**
+- **3. Незначительные замечания**
+- **4. Что изменилось**
+
+CHANGES SINCE THE PREVIOUS VERSION:
+{changes}
+
+RED FLAG LISTS:
+{text}
+"""
@@ -0,0 +1,262 @@
+"""
+Process-wide token bucket rate limiter for LLM providers.
+
+Every (provider, API key) pair gets its own limiter with a requests-per-minute
+and a tokens-per-minute budget. Waiting callers queue in FIFO order and sleep
+with asyncio, so the event loop is never blocked. Bucket state can be kept in
+memory or in a SQLite file shared by several uvicorn workers.
+"""
+
+from typing import Dict, Optional, Tuple
+
+import asyncio
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from loguru import logger
+
+import config
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (~4 characters per token) used before the real usage is known."""
+    return max(1, len(text) // 4)
+
+
+class BucketStore(ABC):
+    """Storage for token bucket levels"""
+
+    @abstractmethod
+    def take(self, key: str, rpm: int, tpm: int, tokens: int) -> float:
+        """
+        Try to take one request and `tokens` tokens from the bucket.
+        Return 0 on success, otherwise number of seconds to wait before the next try.
+        """
+        pass
+
+    @abstractmethod
+    def adjust(self, key: str, tokens: int) -> None:
+        """Return (positive) or charge (negative) tokens after the real usage is known."""
+        pass
+
+    @staticmethod
+    def _refill(
+        requests: float, tokens: float, updated: float, now: float, rpm: int, tpm: int
+    ) -> Tuple[float, float]:
+        elapsed = max(0.0, now - updated)
+        requests = min(float(rpm), requests + elapsed * rpm / 60)
+        if tpm > 0:
+            tokens = min(float(tpm), tokens + elapsed * tpm / 60)
+        return requests, tokens
+
+    @staticmethod
+    def _wait_time(requests: float, tokens: float, rpm: int, tpm: int, needed: int) -> float:
+        wait = 0.0
+        if requests < 1:
+            wait = (1 - requests) * 60 / rpm
+        if tpm > 0 and tokens < needed:
+            wait = max(wait, (needed - tokens) * 60 / tpm)
+        return wait
+
+    def _take(
+        self,
+        state: Optional[Tuple[float, float, float]],
+        now: float,
+        rpm: int,
+        tpm: int,
+        tokens: int,
+    ) -> Tuple[Tuple[float, float, float], float]:
+        """Common bucket logic, returns new state and wait time"""
+        if state is None:
+            state = (float(rpm), float(tpm), now)
+        requests, bucket_tokens = self._refill(*state, now, rpm, tpm)
+        # a single huge request must still be able to pass with a full bucket
+        needed = min(tokens, tpm) if tpm > 0 else 0
+        wait = self._wait_time(requests, bucket_tokens, rpm, tpm, needed)
+        if wait == 0:
+            requests -= 1
+            bucket_tokens -= needed
+        return (requests, bucket_tokens, now), wait
+
+
+class MemoryBucketStore(BucketStore):
+    """Bucket levels kept in the memory of the current process"""
+
+    def __init__(self):
+        self._buckets: Dict[str, Tuple[float, float, float]] = {}
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rpm: int, tpm: int, tokens: int) -> float:
+        with self._lock:
+            state, wait = self._take(self._buckets.get(key), time.time(), rpm, tpm, tokens)
+            self._buckets[key] = state
+            return wait
+
+    def adjust(self, key: str, tokens: int) -> None:
+        with self._lock:
+            if key in self._buckets:
+                requests, bucket_tokens, updated = self._buckets[key]
+                self._buckets[key] = (requests, bucket_tokens + tokens, updated)
+
+
+class SQLiteBucketStore(BucketStore):
+    """Bucket levels kept in a SQLite file, so all workers on the host share one budget"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_buckets ("
+                "key TEXT PRIMARY KEY, requests REAL, tokens REAL, updated REAL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def take(self, key: str, rpm: int, tpm: int, tokens: int) -> float:
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT requests, tokens, updated FROM rate_buckets WHERE key = ?", (key,)
+            ).fetchone()
+            state, wait = self._take(row, time.time(), rpm, tpm, tokens)
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_buckets (key, requests, tokens, updated) VALUES (?, ?, ?, ?)",
+                (key, *state),
+            )
+            conn.execute("COMMIT")
+            return wait
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def adjust(self, key: str, tokens: int) -> None:
+        conn = self._connect()
+        try:
+            conn.execute("UPDATE rate_buckets SET tokens = tokens + ? WHERE key = ?", (tokens, key))
+        finally:
+            conn.close()
+
+
+class RateLimiter:
+    """
+    Token bucket limiter for one (provider, API key) pair.
+    Callers are served in arrival order, later callers wait until earlier ones pass.
+    """
+
+    def __init__(self, key: str, rpm: int, tpm: int, store: BucketStore):
+        self.key = key
+        self.rpm = rpm
+        self.tpm = tpm
+        self.store = store
+        self._lock = asyncio.Lock()
+        self._sync_lock = threading.Lock()
+        self.total_wait_time = 0.0
+        self.waiting = 0
+
+    async def _take(self, tokens: int) -> float:
+        if isinstance(self.store, SQLiteBucketStore):
+            return await asyncio.to_thread(self.store.take, self.key, self.rpm, self.tpm, tokens)
+        return self.store.take(self.key, self.rpm, self.tpm, tokens)
+
+    async def acquire(self, tokens: int = 0) -> float:
+        """Wait until a request with `tokens` input tokens fits the budget. Return seconds waited."""
+        started = time.monotonic()
+        self.waiting += 1
+        try:
+            async with self._lock:
+                while True:
+                    wait = await self._take(tokens)
+                    if wait <= 0:
+                        break
+                    logger.info(
+                        f"Rate limit reached ({self.rpm} RPM, {self.tpm} TPM). Waiting {wait:.1f}s before next request"
+                    )
+                    await asyncio.sleep(wait)
+        finally:
+            self.waiting -= 1
+        waited = time.monotonic() - started
+        self.total_wait_time += waited
+        return waited
+
+    def acquire_blocking(self, tokens: int = 0) -> float:
+        """Blocking version of acquire for synchronous callers."""
+        started = time.monotonic()
+        with self._sync_lock:
+            while True:
+                wait = self.store.take(self.key, self.rpm, self.tpm, tokens)
+                if wait <= 0:
+                    break
+                logger.info(
+                    f"Rate limit reached ({self.rpm} RPM, {self.tpm} TPM). Waiting {wait:.1f}s before next request"
+                )
+                time.sleep(wait)
+        waited = time.monotonic() - started
+        self.total_wait_time += waited
+        return waited
+
+    def _usage_delta(self, estimated_tokens: int, used_tokens: Optional[int]) -> int:
+        if self.tpm <= 0 or used_tokens is None:
+            return 0
+        return min(estimated_tokens, self.tpm) - used_tokens
+
+    def record_usage(self, estimated_tokens: int, used_tokens: Optional[int]) -> None:
+        """Correct the token bucket once the provider reported the real token usage."""
+        delta = self._usage_delta(estimated_tokens, used_tokens)
+        if delta:
+            self.store.adjust(self.key, delta)
+
+    async def arecord_usage(self, estimated_tokens: int, used_tokens: Optional[int]) -> None:
+        """Async version of record_usage, the SQLite store is written in a worker thread."""
+        delta = self._usage_delta(estimated_tokens, used_tokens)
+        if not delta:
+            return
+        if isinstance(self.store, SQLiteBucketStore):
+            await asyncio.to_thread(self.store.adjust, self.key, delta)
+        else:
+            self.store.adjust(self.key, delta)
+
+
+def _create_store() -> BucketStore:
+    if config.RATE_LIMIT_BACKEND == "sqlite":
+        logger.info(f"Using SQLite rate limiter store: {config.RATE_LIMIT_DB}")
+        return SQLiteBucketStore(config.RATE_LIMIT_DB)
+    return MemoryBucketStore()
+
+
+_store: Optional[BucketStore] = None
+_limiters: Dict[Tuple[str, str], RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(provider: str, api_key_hash: str, rpm: int, tpm: int) -> RateLimiter:
+    """Return the process-wide limiter for the given provider and API key."""
+    global _store
+    key = (provider.lower(), api_key_hash)
+    with _limiters_lock:
+        if _store is None:
+            _store = _create_store()
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limiter = RateLimiter(f"{key[0]}:{api_key_hash}", rpm, tpm, _store)
+            _limiters[key] = limiter
+        else:
+            limiter.rpm = rpm
+            limiter.tpm = tpm
+        return limiter
+
+
+def limiter_stats() -> Dict[str, float]:
+    """Aggregated limiter statistics."""
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return {
+        "limiters": len(limiters),
+        "waiting": sum(limiter.waiting for limiter in limiters),
+        "total_wait_time": sum(limiter.total_wait_time for limiter in limiters),
+    }
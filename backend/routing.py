@@ -0,0 +1,396 @@
+"""
+Routing of LLM requests over several backends.
+
+Backends are tried in order of the fallback chain. Transient errors (timeouts, rate limits,
+5xx) are retried with jittered exponential backoff, and a backend which keeps failing is
+skipped for a while by its circuit breaker. With hedging on, a second backend is started
+when the first one has not produced a token within its observed p95 time to first token,
+and whichever answers first wins.
+"""
+
+from typing import (
+    Any,
+    AsyncIterator,
+    Deque,
+    Dict,
+    Hashable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+import asyncio
+import random
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from loguru import logger
+
+import config
+import metrics
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+TRANSIENT_STATUS_CODES = {408, 409, 425, 429, 500, 502, 503, 504, 529}
+TRANSIENT_ERROR_NAMES = re.compile(
+    r"timeout|ratelimit|resourceexhausted|overloaded|unavailable|connection|internalserver",
+    re.IGNORECASE,
+)
+TRANSIENT_ERROR_MESSAGES = re.compile(
+    r"\b(408|429|500|502|503|504|529)\b|timed? ?out|rate limit|resource has been exhausted|"
+    r"overloaded|temporarily unavailable",
+    re.IGNORECASE,
+)
+
+
+class CircuitOpenError(Exception):
+    """The backend's circuit is open or its trial request is already in flight"""
+
+
+def is_transient(error: BaseException) -> bool:
+    """Check if the error is worth retrying (timeouts, rate limits, server errors)."""
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    for attribute in ("status_code", "code", "status"):
+        code = getattr(error, attribute, None)
+        if isinstance(code, int):
+            return code in TRANSIENT_STATUS_CODES
+    if TRANSIENT_ERROR_NAMES.search(type(error).__name__):
+        return True
+    return bool(TRANSIENT_ERROR_MESSAGES.search(str(error)))
+
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter."""
+    ceiling = min(config.LLM_RETRY_MAX_DELAY, config.LLM_RETRY_BASE_DELAY * 2**attempt)
+    return random.uniform(0, ceiling)
+
+
+class CircuitBreaker:
+    """
+    Stops sending requests to a backend after several transient failures in a row.
+    After reset_timeout one trial request is let through, its result closes or reopens the circuit.
+    The circuit is HALF_OPEN only while the trial request is in flight.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def _trial_due(self) -> bool:
+        return self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout
+
+    def available(self) -> bool:
+        """Check if a request would be let through, without taking the trial slot."""
+        with self._lock:
+            return self.state == CLOSED or self._trial_due()
+
+    def acquire(self, force: bool = False) -> Optional[str]:
+        """
+        Call right before sending a request. Returns the state the request was let through in
+        (HALF_OPEN for the trial request), or None if the circuit is open.
+        force lets the request through without taking the trial slot.
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return CLOSED
+            if self._trial_due():
+                self.state = HALF_OPEN
+                return HALF_OPEN
+            return CLOSED if force else None
+
+    def release(self, granted: str) -> None:
+        """The request ended without telling if the backend is healthy (cancelled, bad request)."""
+        with self._lock:
+            if granted == HALF_OPEN and self.state == HALF_OPEN:
+                # the next request becomes the trial
+                self.state = OPEN
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != CLOSED:
+                logger.info(f"Circuit of {self.name} is closed again")
+            self.state = CLOSED
+            self.failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    logger.warning(f"Circuit of {self.name} is open after {self.failures} failures")
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+
+class LatencyWindow:
+    """Rolling window of recent time to first token observations of one backend"""
+
+    def __init__(self, size: int):
+        self.samples: Deque[float] = deque(maxlen=size)
+
+    def observe(self, value: float) -> None:
+        self.samples.append(value)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if len(self.samples) < config.HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+_breakers: Dict[Hashable, CircuitBreaker] = {}
+_latencies: Dict[Hashable, LatencyWindow] = {}
+_registry_lock = threading.Lock()
+
+
+def get_breaker(key: Hashable, name: str) -> CircuitBreaker:
+    """Process-wide circuit breaker of a backend, shared by all answerers using it."""
+    with _registry_lock:
+        breaker = _breakers.get(key)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                name, config.BREAKER_FAILURE_THRESHOLD, config.BREAKER_RESET_TIMEOUT
+            )
+            _breakers[key] = breaker
+        return breaker
+
+
+def get_latency_window(key: Hashable) -> LatencyWindow:
+    with _registry_lock:
+        window = _latencies.get(key)
+        if window is None:
+            window = _latencies[key] = LatencyWindow(config.HEDGE_WINDOW_SIZE)
+        return window
+
+
+def breaker_states() -> Dict[str, str]:
+    with _registry_lock:
+        return {breaker.name: breaker.state for breaker in _breakers.values()}
+
+
+class Backend:
+    """One LLM backend of the chain: the adapter with its circuit breaker and latency window"""
+
+    def __init__(self, adapter: Any, key: Hashable):
+        self.adapter = adapter
+        self.name = f"{adapter.model_provider}/{adapter.llm_model}"
+        self.breaker = get_breaker(key, self.name)
+        self.latency = get_latency_window(key)
+
+    def hedge_delay(self) -> float:
+        p95 = self.latency.percentile(0.95)
+        return config.HEDGE_DEFAULT_DELAY if p95 is None else p95
+
+
+class LLMRouter:
+    """
+    Sends requests to the first healthy backend of the chain.
+    Has the same invoke/ainvoke/astream interface as AIAdapter.
+    """
+
+    def __init__(self, backends: Sequence[Backend], hedge: bool = False):
+        self.backends = list(backends)
+        self.hedge = hedge and len(self.backends) > 1
+
+    def _available(self) -> Tuple[List[Backend], bool]:
+        """Backends to try in order, and whether their circuits should be ignored."""
+        available = [backend for backend in self.backends if backend.breaker.available()]
+        if not available:
+            # every circuit is open, trying is better than failing without a request
+            logger.warning("All LLM backends have open circuits, trying the first one")
+            return self.backends[:1], True
+        return available, False
+
+    @staticmethod
+    @contextmanager
+    def _attempt(backend: Backend, force: bool) -> Iterator[None]:
+        """
+        One request to the backend. Its result is recorded by the circuit breaker, and the
+        trial slot is released if the request is cancelled or fails with a non-transient error.
+        """
+        granted = backend.breaker.acquire(force)
+        if granted is None:
+            raise CircuitOpenError(f"Circuit of {backend.name} is open")
+        try:
+            yield
+        except Exception as e:
+            if is_transient(e):
+                backend.breaker.record_failure()
+            else:
+                backend.breaker.release(granted)
+            raise
+        except BaseException:
+            backend.breaker.release(granted)
+            raise
+        backend.breaker.record_success()
+
+    @staticmethod
+    def _failed(backend: Backend, error: BaseException, attempt: int) -> bool:
+        """Return True if the same backend should be retried."""
+        if isinstance(error, CircuitOpenError):
+            return False
+        transient = is_transient(error)
+        logger.warning(
+            f"LLM backend {backend.name} failed (attempt {attempt + 1}, "
+            f"transient={transient}): {str(error)}"
+        )
+        retry = transient and attempt < config.LLM_RETRIES and backend.breaker.available()
+        if retry:
+            metrics.llm_failovers.inc(provider=backend.adapter.model_provider, reason="retry")
+        return retry
+
+    @staticmethod
+    def _failover(backend: Backend, error: BaseException) -> None:
+        metrics.llm_failovers.inc(provider=backend.adapter.model_provider, reason="failover")
+        logger.warning(f"Failing over from {backend.name}: {type(error).__name__}")
+
+    def invoke(self, prompt) -> Any:
+        error: Optional[BaseException] = None
+        available, force = self._available()
+        for backend in available:
+            for attempt in range(config.LLM_RETRIES + 1):
+                try:
+                    with self._attempt(backend, force):
+                        return backend.adapter.invoke(prompt)
+                except Exception as e:
+                    error = e
+                    if not self._failed(backend, e, attempt):
+                        break
+                    time.sleep(backoff_delay(attempt))
+            self._failover(backend, error)
+        raise error
+
+    async def ainvoke(self, prompt) -> Any:
+        if self.hedge:
+            # time to first token is only observable on a stream
+            response = None
+            async for chunk in self.astream(prompt):
+                response = chunk if response is None else response + chunk
+            return response
+
+        error: Optional[BaseException] = None
+        available, force = self._available()
+        for backend in available:
+            for attempt in range(config.LLM_RETRIES + 1):
+                try:
+                    with self._attempt(backend, force):
+                        return await backend.adapter.ainvoke(prompt)
+                except Exception as e:
+                    error = e
+                    if not self._failed(backend, e, attempt):
+                        break
+                    await asyncio.sleep(backoff_delay(attempt))
+            self._failover(backend, error)
+        raise error
+
+    @classmethod
+    async def _open_stream(
+        cls, backend: Backend, prompt, force: bool
+    ) -> Tuple[Backend, AsyncIterator, Any]:
+        """
+        Start streaming from the backend and wait for its first chunk.
+        The first chunk is enough for the circuit breaker to count the backend as healthy.
+        """
+        started = time.perf_counter()
+        with cls._attempt(backend, force):
+            stream = backend.adapter.astream(prompt)
+            try:
+                first = await stream.__anext__()
+            except BaseException:
+                await stream.aclose()
+                raise
+        backend.latency.observe(time.perf_counter() - started)
+        return backend, stream, first
+
+    async def _open_with_retries(
+        self, backend: Backend, prompt, force: bool = False
+    ) -> Tuple[Backend, AsyncIterator, Any]:
+        for attempt in range(config.LLM_RETRIES + 1):
+            try:
+                return await self._open_stream(backend, prompt, force)
+            except Exception as e:
+                if not self._failed(backend, e, attempt):
+                    raise
+                await asyncio.sleep(backoff_delay(attempt))
+
+    async def _race(
+        self, primary: Backend, secondary: Backend, prompt
+    ) -> Tuple[Backend, AsyncIterator, Any]:
+        """Start the secondary backend if the primary is slower than its p95 to the first token."""
+        tasks = [asyncio.create_task(self._open_with_retries(primary, prompt))]
+        winner: Optional[asyncio.Task] = None
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=primary.hedge_delay())
+            if not done:
+                logger.info(f"Hedging slow {primary.name} with {secondary.name}")
+                metrics.llm_failovers.inc(provider=secondary.adapter.model_provider, reason="hedge")
+                tasks.append(asyncio.create_task(self._open_with_retries(secondary, prompt)))
+            pending = set(tasks)
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        winner = task
+                        return task.result()
+                if len(tasks) == 1:
+                    # primary failed before the hedge delay, fail over right away
+                    self._failover(primary, tasks[0].exception())
+                    tasks.append(asyncio.create_task(self._open_with_retries(secondary, prompt)))
+                    pending = {tasks[-1]}
+                elif not pending:
+                    raise tasks[-1].exception()
+        finally:
+            losers = [task for task in tasks if task is not winner]
+            for task in losers:
+                task.cancel()
+            await asyncio.gather(*losers, return_exceptions=True)
+            for task in losers:
+                # the loser may have got its first chunk at the same moment as the winner
+                if not task.cancelled() and task.exception() is None:
+                    await task.result()[1].aclose()
+
+    async def astream(self, prompt) -> AsyncIterator[Any]:
+        available, force = self._available()
+        error: Optional[BaseException] = None
+        opened = None
+        index = 0
+        while index < len(available):
+            backend = available[index]
+            hedge_with = available[index + 1] if self.hedge and index + 1 < len(available) else None
+            try:
+                if hedge_with is not None:
+                    opened = await self._race(backend, hedge_with, prompt)
+                else:
+                    opened = await self._open_with_retries(backend, prompt, force)
+                break
+            except Exception as e:
+                error = e
+                index += 1 if hedge_with is None else 2
+                self._failover(available[index - 1], e)
+        if opened is None:
+            raise error
+
+        backend, stream, first = opened
+        # after the first chunk the answer can't be moved to another backend
+        try:
+            yield first
+            async for chunk in stream:
+                yield chunk
+        except Exception as e:
+            if is_transient(e):
+                backend.breaker.record_failure()
+            raise
+        finally:
+            await stream.aclose()
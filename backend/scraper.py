@@ -0,0 +1,324 @@
+"""
+Download pages and documents and extract plain text from them.
+
+Pages are fetched with a tiered strategy: a plain pooled HTTP GET first, and a
+full Chromium render only if the static page looks like it needs JavaScript.
+Which tier worked is remembered per domain.
+"""
+
+from typing import Dict, Optional, Tuple
+
+import os
+import re
+import tempfile
+import time
+import httpx
+from collections import OrderedDict
+from urllib.parse import urlparse
+from loguru import logger
+from bs4 import BeautifulSoup
+from fastapi import HTTPException
+
+import config
+import metrics
+from browser_pool import USER_AGENT, browser_pool
+from cache import FetchedPage, fetch_cache
+from pdf_extract import PdfTooLargeError, extract_pdf_text
+from singleflight import SingleFlight
+
+STATIC_TIER = "static"
+BROWSER_TIER = "browser"
+
+# Markers of single page application shells which render their content with JavaScript
+SPA_SHELL_PATTERNS = re.compile(
+    r'<div[^>]+id=["\'](root|app|__next|__nuxt)["\'][^>]*>\s*</div>'
+    r"|enable javascript|javascript is required|you need to enable javascript",
+    re.IGNORECASE,
+)
+
+# whole id/class names of page elements around the document body, e.g. "cookie-banner",
+# but not "has-sidebar" or "shareable-content" which themes put on the content wrapper
+BOILERPLATE_WORDS = (
+    r"(cookies?|consent|gdpr|banner|newsletter|subscribe|share|social|breadcrumbs?|sidebar|"
+    r"popup|modal)"
+)
+BOILERPLATE_ELEMENT = re.compile(
+    rf"{BOILERPLATE_WORDS}([-_]{BOILERPLATE_WORDS})*"
+    r"([-_](bar|box|buttons?|links?|icons?|notice|container|widget|wrapper|overlay|dialog))?",
+    re.IGNORECASE,
+)
+MAIN_CONTENT_MIN_SHARE = 0.3
+# elements holding more of the page text than this are never boilerplate
+BOILERPLATE_MAX_SHARE = 0.5
+
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Process-wide HTTP client, so connections to the same hosts are reused."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            headers={"User-Agent": USER_AGENT},
+            follow_redirects=True,
+            timeout=config.HTTP_TIMEOUT,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+        )
+    return _http_client
+
+
+async def close_http_client() -> None:
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+class DomainTierMemory:
+    """Remember per domain whether the static fetch was enough or the page had to be rendered"""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._tiers: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+
+    def get(self, domain: str) -> Optional[str]:
+        entry = self._tiers.get(domain)
+        if entry is None:
+            return None
+        tier, updated = entry
+        if time.time() - updated > self.ttl:
+            del self._tiers[domain]
+            return None
+        return tier
+
+    def set(self, domain: str, tier: str) -> None:
+        self._tiers[domain] = (tier, time.time())
+        self._tiers.move_to_end(domain)
+        while len(self._tiers) > self.max_size:
+            self._tiers.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        tiers = [tier for tier, _ in self._tiers.values()]
+        return {STATIC_TIER: tiers.count(STATIC_TIER), BROWSER_TIER: tiers.count(BROWSER_TIER)}
+
+
+domain_tiers = DomainTierMemory(config.DOMAIN_TIER_MEMORY_SIZE, config.DOMAIN_TIER_TTL)
+fetch_flight = SingleFlight("fetch")
+
+
+def html_to_text(content: str) -> str:
+    """Extract visible text from HTML page."""
+    with metrics.timed("html_extract"):
+        return _html_to_text(content)
+
+
+def _is_boilerplate_element(tag) -> bool:
+    if tag.name in ("html", "body", "main", "article"):
+        return False
+    names = [tag.get("id") or ""] + (tag.get("class") or [])
+    return any(BOILERPLATE_ELEMENT.fullmatch(name) for name in names if name)
+
+
+def _contains_main_content(tag, page_length: int) -> bool:
+    if tag.find(["main", "article"]) or tag.find(attrs={"role": "main"}):
+        return True
+    return len(tag.get_text().strip()) > BOILERPLATE_MAX_SHARE * page_length
+
+
+def _html_to_text(content: str) -> str:
+    soup = BeautifulSoup(content, "html.parser")
+
+    # Remove script and style elements
+    for script in soup(["script", "style", "header", "footer", "nav", "aside"]):
+        script.extract()
+    # Remove cookie banners, share buttons, sidebars and similar page furniture
+    page_length = len(soup.get_text().strip())
+    for element in soup.find_all(_is_boilerplate_element):
+        if not _contains_main_content(element, page_length):
+            element.extract()
+
+    # Use the main content element if the page marks it and it holds most of the text
+    text = soup.get_text()
+    main = soup.find("main") or soup.find(attrs={"role": "main"}) or soup.find("article")
+    if main is not None:
+        main_text = main.get_text()
+        if len(main_text.strip()) >= MAIN_CONTENT_MIN_SHARE * len(text.strip()):
+            text = main_text
+    # Clean up whitespace
+    lines = (line.strip() for line in text.splitlines())
+    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+    return "\n".join(chunk for chunk in chunks if chunk)
+
+
+def looks_js_gated(html: str, text: str) -> bool:
+    """Check if statically fetched page probably needs JavaScript to show its content."""
+    if len(text) < config.STATIC_MIN_TEXT_LENGTH:
+        return True
+    return bool(SPA_SHELL_PATTERNS.search(html)) and len(text) < 4 * config.STATIC_MIN_TEXT_LENGTH
+
+
+def _is_pdf(url: str, response: Optional[httpx.Response] = None) -> bool:
+    if response is not None and "application/pdf" in response.headers.get("content-type", ""):
+        return True
+    return urlparse(url).path.lower().endswith(".pdf")
+
+
+def _cache_page(url: str, text: str, headers) -> FetchedPage:
+    return FetchedPage(
+        url=url,
+        text=text,
+        etag=headers.get("etag"),
+        last_modified=headers.get("last-modified"),
+    )
+
+
+async def _get(url: str, cached: Optional[FetchedPage]) -> httpx.Response:
+    """Send GET request without reading the body, the caller must close the response."""
+    headers = cached.conditional_headers() if cached else {}
+    client = get_http_client()
+    return await client.send(client.build_request("GET", url, headers=headers), stream=True)
+
+
+async def _fetch_pdf(url: str, response: httpx.Response) -> str:
+    """
+    Stream PDF body to memory or, above the spool threshold, to a temp file,
+    then extract its text in the PDF process pool.
+    """
+    content_length = int(response.headers.get("content-length") or 0)
+    if content_length > config.PDF_MAX_BYTES:
+        raise HTTPException(status_code=400, detail=f"PDF is too large: {content_length} bytes")
+
+    buffer = bytearray()
+    temp_file = None
+    size = 0
+    try:
+        async for chunk in response.aiter_bytes():
+            size += len(chunk)
+            if size > config.PDF_MAX_BYTES:
+                raise HTTPException(
+                    status_code=400, detail=f"PDF is larger than {config.PDF_MAX_BYTES} bytes"
+                )
+            if temp_file is None and size > config.PDF_SPOOL_SIZE:
+                temp_file = tempfile.NamedTemporaryFile(suffix=".pdf", delete=False)
+                temp_file.write(buffer)
+                buffer = bytearray()
+            if temp_file is not None:
+                temp_file.write(chunk)
+            else:
+                buffer.extend(chunk)
+        logger.info(f"File downloaded. Size: {size} bytes")
+
+        if temp_file is not None:
+            temp_file.close()
+            source = temp_file.name
+        else:
+            source = bytes(buffer)
+        try:
+            with metrics.timed("pdf_extract"):
+                text = await extract_pdf_text(
+                    source, config.PDF_MAX_PAGES, config.PDF_WORKERS, config.PDF_PAGES_PER_TASK
+                )
+        except PdfTooLargeError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        if temp_file is not None:
+            temp_file.close()
+            os.unlink(temp_file.name)
+
+    await fetch_cache.aset(_cache_page(url, text, response.headers))
+    logger.info(f"URL extraction completed (PDF): {len(text)} characters")
+    return text
+
+
+async def _render_html(url: str) -> str:
+    """Render page in the headless browser and extract its text."""
+    response = None
+    async with browser_pool.page() as page:
+        try:
+            response = await page.goto(url, wait_until="domcontentloaded", timeout=30000)
+            logger.debug(f"Page loaded: {url}, status: {response.status if response else 'N/A'}")
+        except Exception as e:
+            logger.warning(f"Page navigation timeout or error for {url}: {str(e)}")
+            # If networkidle times out, we still might have useful content
+            pass
+
+        content = await page.content()
+
+    result = html_to_text(content)
+    if response is not None and response.ok:
+        await fetch_cache.aset(_cache_page(url, result, response.headers))
+    logger.info(f"URL extraction completed (rendered HTML): {len(result)} characters")
+    return result
+
+
+async def _extract_text_from_url(url):
+    try:
+        logger.info(f"Starting URL extraction: {url}")
+        cached = await fetch_cache.aget(url)
+        domain = urlparse(url).netloc.lower()
+        tier = domain_tiers.get(domain)
+        if (
+            tier == BROWSER_TIER
+            and not _is_pdf(url)
+            and not (cached and cached.conditional_headers())
+        ):
+            # nothing to revalidate and static fetch is known to be useless for this domain
+            return await _render_html(url)
+
+        try:
+            response = await _get(url, cached)
+        except httpx.HTTPError as e:
+            # Some sites drop clients that don't look like a browser
+            logger.warning(f"Static fetch failed for {url}: {str(e)}")
+            if _is_pdf(url):
+                raise
+            return await _render_html(url)
+
+        js_gated = False
+        try:
+            if response.status_code == 304 and cached is not None:
+                logger.info(f"Page not modified, using cached text: {url}")
+                await fetch_cache.atouch(cached)
+                return cached.text
+
+            if _is_pdf(url, response):
+                if not response.is_success:
+                    logger.error(f"Failed to load: {response.status_code}")
+                    raise HTTPException(
+                        status_code=400, detail=f"Failed to load: {response.status_code}"
+                    )
+                return await _fetch_pdf(url, response)
+
+            if tier != BROWSER_TIER and response.is_success:
+                await response.aread()
+                html = response.text
+                text = html_to_text(html)
+                if not looks_js_gated(html, text):
+                    domain_tiers.set(domain, STATIC_TIER)
+                    await fetch_cache.aset(_cache_page(url, text, response.headers))
+                    logger.info(f"URL extraction completed (static HTML): {len(text)} characters")
+                    return text
+                js_gated = True
+                logger.info(f"Static page looks JavaScript-gated, rendering it in browser: {url}")
+        finally:
+            await response.aclose()
+
+        # failed static responses (403 from bot protection, a dead link) are rendered too,
+        # but only JavaScript-gated pages say something about the whole domain
+        result = await _render_html(url)
+        if js_gated:
+            domain_tiers.set(domain, BROWSER_TIER)
+        return result
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to scrape URL {url}: {str(e)}")
+        metrics.count_error("scrape", e)
+        raise HTTPException(status_code=400, detail=f"Failed to scrape URL: {str(e)}")
+
+
+async def extract_text_from_url(url):
+    """Extract text from URL, concurrent requests for the same URL share one download."""
+    with metrics.timed("scrape"):
+        return await fetch_flight.do(url, lambda: _extract_text_from_url(url))
@@ -1,18 +1,62 @@
-from typing import Optional
+from typing import Any, AsyncContextManager, AsyncIterator, Dict, List, Optional, Tuple
 
-import uvicorn
-import io
 import asyncio
+import json
+import uvicorn
+from contextlib import asynccontextmanager, nullcontext
 from loguru import logger
-from pypdf import PdfReader
-from bs4 import BeautifulSoup
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
-from playwright.async_api import async_playwright
-from llm import GPTAnswerer
+import config
+import metrics
+from browser_pool import browser_pool
+from cache import analysis_cache, analysis_cache_key, chunk_cache, fetch_cache
+from compaction import CompactionReport, compact
+from fingerprints import clause_index
+from incremental import analyze_incremental
+from jobs import JobQueue, QueueFullError
+from llm import FallbackModel, GPTAnswerer, get_answerer
+from pdf_extract import shutdown_executor
+from routing import OPEN, breaker_states
+from scraper import close_http_client, extract_text_from_url
+from singleflight import SingleFlight
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Start the browser once, so scraping requests don't pay for a Chromium launch
+    try:
+        await browser_pool.start()
+    except Exception as e:
+        logger.error(f"Failed to start browser pool, it will be started on first use: {str(e)}")
+    job_queue.start()
+    yield
+    await job_queue.stop()
+    await close_http_client()
+    await browser_pool.stop()
+    # join the PDF workers off the event loop, so no worker process outlives the server
+    await asyncio.to_thread(shutdown_executor, True)
+
+
+app = FastAPI(lifespan=lifespan)
+analysis_flight = SingleFlight("analysis")
+
+
+@app.middleware("http")
+async def track_requests(request: Request, call_next):
+    """Count in-flight requests and add per-stage timings in the Server-Timing header."""
+    timings = metrics.start_request_timings()
+    metrics.in_flight_requests.inc()
+    try:
+        response = await call_next(request)
+    finally:
+        metrics.in_flight_requests.dec()
+    if config.SERVER_TIMING and timings:
+        response.headers["Server-Timing"] = metrics.server_timing_header(timings)
+    return response
 
-app = FastAPI()
 
 # Allow Chrome Extension to access this server
 app.add_middleware(
@@ -23,6 +67,12 @@ app.add_middleware(
 )
 
 
+class FallbackBackend(BaseModel):
+    llm_model_provider: str
+    llm_model: str
+    api_key: Optional[str] = None  # the main API key is used if not set
+
+
 class AnalysisRequest(BaseModel):
     api_key: str
     text: Optional[str] = None
@@ -32,76 +82,35 @@ class AnalysisRequest(BaseModel):
     temperature: float = 0.4
     free_tier: bool = True
     free_tier_rpm_limit: int = 15
+    max_input_tokens: Optional[int] = None
+    fallbacks: List[FallbackBackend] = []
+    hedge: bool = False
+    # re-analyse only clauses changed since the last analysis of the same URL
+    incremental: bool = False
 
 
-async def extract_text_from_url(url):
-    try:
-        logger.info(f"Starting URL extraction: {url}")
-        async with async_playwright() as p:
-            if url.lower().endswith(".pdf"):
-                request_context = await p.request.new_context()
-                response = await request_context.get(url)
-
-                if response.ok:
-                    data = await response.body()
-                    logger.info(f"File downloaded. Size: {len(data)} bytes")
-
-                    pdf_file = io.BytesIO(data)
-                    reader = PdfReader(pdf_file)
-                    logger.info(f"Number of pages: {len(reader.pages)}")
-
-                    full_text = ""
-                    for page in reader.pages:
-                        full_text += page.extract_text() + "\n"
-
-                    return full_text
-                else:
-                    logger.error(f"Failed to load: {response.status}")
-                    raise HTTPException(
-                        status_code=400, detail=f"Failed to load: {response.status}"
-                    )
-
-            browser = await p.chromium.launch(headless=True)
-            page = await browser.new_page(
-                user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-            )
+class BatchItem(BaseModel):
+    id: Optional[str] = None
+    text: Optional[str] = None
+    url: Optional[str] = None
 
-            response = None
-            try:
-                response = await page.goto(url, wait_until="domcontentloaded", timeout=30000)
-                logger.debug(
-                    f"Page loaded: {url}, status: {response.status if response else 'N/A'}"
-                )
-            except Exception as e:
-                logger.warning(f"Page navigation timeout or error for {url}: {str(e)}")
-                # If networkidle times out, we still might have useful content
-                pass
-
-            content = await page.content()
-            await browser.close()
-
-        soup = BeautifulSoup(content, "html.parser")
-
-        # Remove script and style elements
-        for script in soup(["script", "style", "header", "footer", "nav"]):
-            script.extract()
-
-        text = soup.get_text()
-        # Clean up whitespace
-        lines = (line.strip() for line in text.splitlines())
-        chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-        result = "\n".join(chunk for chunk in chunks if chunk)
-        logger.info(f"URL extraction completed (HTML): {len(result)} characters")
-        return result
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"Failed to scrape URL {url}: {str(e)}")
-        raise HTTPException(status_code=400, detail=f"Failed to scrape URL: {str(e)}")
+
+class BatchAnalysisRequest(BaseModel):
+    api_key: str
+    items: List[BatchItem]
+    llm_model: str = "gemini-2.0-flash"
+    llm_model_provider: str = "Gemini"
+    temperature: float = 0.4
+    free_tier: bool = True
+    free_tier_rpm_limit: int = 15
+    max_input_tokens: Optional[int] = None
+    fallbacks: List[FallbackBackend] = []
+    hedge: bool = False
+    # re-analyse only clauses changed since the last analysis of the same URL
+    incremental: bool = False
 
 
-@app.post("/analyze")
-async def analyze(request: AnalysisRequest):
+def log_request(request: AnalysisRequest) -> None:
     logger.info(
         f"Analysis request received - Provider: {request.llm_model_provider}, "
         f"Model: {request.llm_model}, URL: {request.url is not None}, "
@@ -112,7 +121,9 @@ async def analyze(request: AnalysisRequest):
         logger.warning("Analysis request rejected: API Key missing")
         raise HTTPException(status_code=401, detail="API Key missing")
 
-    # 1. Determine Source (URL scrape vs Raw Text)
+
+async def get_content_to_analyze(request: AnalysisRequest) -> str:
+    """Determine Source (URL scrape vs Raw Text) and check there is enough text."""
     content_to_analyze = request.text
     if request.url:
         logger.info(f"Extracting content from URL: {request.url}")
@@ -120,36 +131,362 @@ async def analyze(request: AnalysisRequest):
     elif request.text:
         logger.info(f"Using provided text: {len(request.text)} characters")
 
+    check_enough_content(content_to_analyze)
+    return content_to_analyze
+
+
+def check_enough_content(content_to_analyze: Optional[str]) -> None:
     if not content_to_analyze or len(content_to_analyze) < 50:
         logger.warning(
             f"Insufficient content to analyze: {len(content_to_analyze) if content_to_analyze else 0} characters"
         )
         raise HTTPException(status_code=400, detail="Not enough text found to analyze.")
 
+
+async def compact_content(
+    request: AnalysisRequest, content_to_analyze: str
+) -> Tuple[str, CompactionReport]:
+    """Drop boilerplate and fit the text into the token budget of the request."""
+    budget = config.INPUT_TOKEN_BUDGET
+    if request.max_input_tokens:
+        budget = min(budget, request.max_input_tokens) if budget else request.max_input_tokens
+    with metrics.timed("compact"):
+        compacted, report = await asyncio.to_thread(
+            compact,
+            content_to_analyze,
+            request.llm_model_provider,
+            request.llm_model,
+            budget,
+            config.PREFILL_TOKENS_PER_SECOND,
+        )
+    # the page may have been nothing but boilerplate
+    check_enough_content(compacted)
+    return compacted, report
+
+
+def get_request_answerer(request: AnalysisRequest) -> GPTAnswerer:
+    return get_answerer(
+        api_key=request.api_key,
+        llm_proxy="",
+        llm_provider=request.llm_model_provider,
+        llm_model=request.llm_model,
+        temperature=request.temperature,
+        free_tier=request.free_tier,
+        free_tier_rpm_limit=request.free_tier_rpm_limit,
+        fallbacks=tuple(
+            FallbackModel(fallback.llm_model_provider, fallback.llm_model, fallback.api_key or "")
+            for fallback in request.fallbacks
+        ),
+        hedge=request.hedge,
+    )
+
+
+def get_cache_key(request: AnalysisRequest, content_to_analyze: str) -> str:
+    return analysis_cache_key(
+        content_to_analyze,
+        request.llm_model_provider,
+        request.llm_model,
+        request.temperature,
+        fallbacks=[
+            (fallback.llm_model_provider, fallback.llm_model) for fallback in request.fallbacks
+        ],
+    )
+
+
+def analysis_metadata(
+    compaction: CompactionReport,
+    cached: bool,
+    tokens: Dict[str, int],
+    changes: Optional[Dict[str, int]] = None,
+) -> Dict[str, Any]:
+    """
+    Compaction of the input and LLM token usage, including tokens read from the prompt cache.
+    Incremental analyses also report clause changes since the previous version.
+    """
+    metadata = {"cached": cached, "compaction": compaction.to_dict(), "tokens": tokens}
+    if changes is not None:
+        metadata["changes"] = changes
+    return metadata
+
+
+def analysis_result(
+    response: str,
+    compaction: CompactionReport,
+    cached: bool,
+    tokens: Dict[str, int],
+    changes: Optional[Dict[str, int]] = None,
+) -> Dict[str, Any]:
+    return {"result": response, "metadata": analysis_metadata(compaction, cached, tokens, changes)}
+
+
+async def run_incremental_analysis(
+    request: AnalysisRequest, content_to_analyze: str, llm_slot: AsyncContextManager
+) -> Tuple[str, Dict[str, int]]:
+    """Analyse only clauses changed since the stored version of the URL."""
+
+    async def analyze_changes() -> Tuple[str, Dict[str, int]]:
+        gpt_answerer = get_request_answerer(request)
+        async with llm_slot:
+            return await analyze_incremental(gpt_answerer, request.url, content_to_analyze)
+
+    try:
+        key = ("incremental", request.url, get_cache_key(request, content_to_analyze))
+        return await analysis_flight.do(key, analyze_changes, retry_on_error=True)
+    except Exception as e:
+        logger.error(f"Incremental analysis failed: {str(e)}", exc_info=True)
+        metrics.count_error("analysis", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+async def run_analysis(
+    request: AnalysisRequest,
+    scrape_slot: AsyncContextManager = nullcontext(),
+    llm_slot: AsyncContextManager = nullcontext(),
+) -> Dict[str, Any]:
+    """
+    Scrape (if needed) and analyze the agreement, slots limit concurrency of the stages.
+    Returns the analysis and metadata about compaction of the input and token usage.
+    """
+    tokens = metrics.start_request_usage()
+    async with scrape_slot:
+        content_to_analyze = await get_content_to_analyze(request)
+    content_to_analyze, compaction = await compact_content(request, content_to_analyze)
+
+    if request.incremental and request.url:
+        response, changes = await run_incremental_analysis(request, content_to_analyze, llm_slot)
+        cached = changes["analyzed_clauses"] == 0 and not changes["removed"]
+        return analysis_result(response, compaction, cached, tokens, changes)
+
     logger.info(
         f"Starting LLM analysis: {len(content_to_analyze)} characters, free_tier={request.free_tier}"
     )
-    try:
-        gpt_answerer = GPTAnswerer(
-            api_key=request.api_key,
-            llm_proxy="",
-            llm_provider=request.llm_model_provider,
-            llm_model=request.llm_model,
-            temperature=request.temperature,
-            free_tier=request.free_tier,
-            free_tier_rpm_limit=request.free_tier_rpm_limit,
-        )
-        response = gpt_answerer.analyze_agreement(content_to_analyze)
+    cache_key = get_cache_key(request, content_to_analyze)
+    cached_response = await analysis_cache.aget(cache_key)
+    if cached_response is not None:
+        logger.info(f"Returning cached analysis: {len(cached_response)} characters in response")
+        return analysis_result(cached_response, compaction, cached=True, tokens=tokens)
+
+    async def analyze_content() -> str:
+        gpt_answerer = get_request_answerer(request)
+        async with llm_slot:
+            response = await gpt_answerer.aanalyze_agreement(content_to_analyze)
         logger.info(f"Analysis completed successfully: {len(response)} characters in response")
+        await analysis_cache.aset(cache_key, response)
         # with open("response.txt", "w") as f:
         #     f.write(response)
-        return {"result": response}
+        return response
+
+    try:
+        # identical analyses running at the same time share one LLM call, a failure of the
+        # shared call may come from the other caller's API key, so it's not shared
+        response = await analysis_flight.do(cache_key, analyze_content, retry_on_error=True)
+        return analysis_result(response, compaction, cached=False, tokens=tokens)
 
     except Exception as e:
         logger.error(f"Analysis failed: {str(e)}", exc_info=True)
+        metrics.count_error("analysis", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/analyze")
+async def analyze(request: AnalysisRequest):
+    log_request(request)
+    return await run_analysis(request)
+
+
+async def run_analysis_job(request: AnalysisRequest, queue: JobQueue) -> Dict[str, Any]:
+    return await run_analysis(request, queue.stage("scrape"), queue.stage("llm"))
+
+
+job_queue = JobQueue(
+    run_analysis_job,
+    workers=config.JOB_WORKERS,
+    max_queue_size=config.JOB_QUEUE_SIZE,
+    stage_limits={"scrape": config.JOB_SCRAPE_CONCURRENCY, "llm": config.JOB_LLM_CONCURRENCY},
+    result_ttl=config.JOB_RESULT_TTL,
+)
+
+
+@app.post("/jobs", status_code=202)
+async def create_job(request: AnalysisRequest):
+    """Queue analysis and return job ID to poll with GET /jobs/{job_id}."""
+    log_request(request)
+    try:
+        job = job_queue.submit(request)
+    except QueueFullError:
+        logger.warning("Job rejected: queue is full")
+        raise HTTPException(
+            status_code=503,
+            detail="Server is busy, try again later.",
+            headers={"Retry-After": str(config.JOB_RETRY_AFTER)},
+        )
+    return job.to_dict()
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired.")
+    return job.to_dict()
+
+
+def sse_event(event: str, data: dict) -> str:
+    """Format server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def stream_analysis(request: AnalysisRequest) -> AsyncIterator[str]:
+    try:
+        if request.url:
+            yield sse_event("progress", {"stage": "scrape", "status": "started"})
+        content_to_analyze = await get_content_to_analyze(request)
+        yield sse_event(
+            "progress",
+            {"stage": "extract", "status": "done", "characters": len(content_to_analyze)},
+        )
+        content_to_analyze, compaction = await compact_content(request, content_to_analyze)
+        yield sse_event("progress", {"stage": "compact", "status": "done", **compaction.to_dict()})
+
+        if request.incremental and request.url:
+            # the answer is merged from clause findings, so it's sent in one piece
+            yield sse_event("progress", {"stage": "llm", "status": "started"})
+            tokens = metrics.start_request_usage()
+            response, changes = await run_incremental_analysis(
+                request, content_to_analyze, nullcontext()
+            )
+            cached = changes["analyzed_clauses"] == 0 and not changes["removed"]
+            yield sse_event("token", {"text": response})
+            yield sse_event("done", analysis_metadata(compaction, cached, tokens, changes))
+            return
+
+        cache_key = get_cache_key(request, content_to_analyze)
+        cached_response = await analysis_cache.aget(cache_key)
+        if cached_response is not None:
+            logger.info(f"Streaming cached analysis: {len(cached_response)} characters in response")
+            yield sse_event("token", {"text": cached_response})
+            yield sse_event("done", analysis_metadata(compaction, cached=True, tokens={}))
+            return
+
+        yield sse_event("progress", {"stage": "llm", "status": "started"})
+        tokens = metrics.start_request_usage()
+        gpt_answerer = get_request_answerer(request)
+        chunks = []
+        async for token in gpt_answerer.astream_agreement(content_to_analyze):
+            chunks.append(token)
+            yield sse_event("token", {"text": token})
+        response = "".join(chunks)
+        logger.info(f"Streamed analysis completed: {len(response)} characters in response")
+        await analysis_cache.aset(cache_key, response)
+        yield sse_event("done", analysis_metadata(compaction, cached=False, tokens=tokens))
+    except HTTPException as e:
+        yield sse_event("error", {"status_code": e.status_code, "detail": e.detail})
+    except Exception as e:
+        logger.error(f"Streamed analysis failed: {str(e)}", exc_info=True)
+        yield sse_event("error", {"status_code": 500, "detail": str(e)})
+
+
+@app.post("/analyze/stream")
+async def analyze_stream(request: AnalysisRequest):
+    """Stream progress events and analysis tokens as server-sent events."""
+    log_request(request)
+    return StreamingResponse(
+        stream_analysis(request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def stream_batch(batch: BatchAnalysisRequest) -> AsyncIterator[str]:
+    """Analyze batch items concurrently and yield NDJSON lines in order of completion."""
+    scrape_slot = asyncio.Semaphore(config.BATCH_SCRAPE_CONCURRENCY)
+    llm_slot = asyncio.Semaphore(config.BATCH_LLM_CONCURRENCY)
+    settings = batch.model_dump(exclude={"items"})
+
+    async def analyze_item(index: int, item: BatchItem) -> dict:
+        line = {"index": index, "id": item.id}
+        try:
+            request = AnalysisRequest(**settings, text=item.text, url=item.url)
+            result = await run_analysis(request, scrape_slot, llm_slot)
+            line.update(status="ok", **result)
+        except HTTPException as e:
+            line.update(status="error", status_code=e.status_code, error=str(e.detail))
+        except Exception as e:
+            logger.error(f"Batch item {index} failed: {str(e)}", exc_info=True)
+            line.update(status="error", status_code=500, error=str(e))
+        return line
+
+    tasks = [asyncio.create_task(analyze_item(i, item)) for i, item in enumerate(batch.items)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            line = await next_done
+            yield json.dumps(line, ensure_ascii=False) + "\n"
+        logger.info(f"Batch analysis completed: {len(tasks)} items")
+    finally:
+        # client went away, don't keep spending tokens on the rest
+        for task in tasks:
+            task.cancel()
+
+
+@app.post("/analyze/batch")
+async def analyze_batch(batch: BatchAnalysisRequest):
+    """Analyze many URLs and/or texts, results are streamed as NDJSON as each item finishes."""
+    logger.info(
+        f"Batch analysis request received - Provider: {batch.llm_model_provider}, "
+        f"Model: {batch.llm_model}, items: {len(batch.items)}"
+    )
+    if not batch.api_key:
+        logger.warning("Batch analysis request rejected: API Key missing")
+        raise HTTPException(status_code=401, detail="API Key missing")
+    if not batch.items:
+        raise HTTPException(status_code=400, detail="Batch is empty.")
+    if len(batch.items) > config.BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=400, detail=f"Batch is too large, limit is {config.BATCH_MAX_ITEMS} items."
+        )
+    return StreamingResponse(stream_batch(batch), media_type="application/x-ndjson")
+
+
+def collect_component_metrics() -> None:
+    for name, cache in (("analysis", analysis_cache), ("chunk", chunk_cache)):
+        stats = cache.stats()
+        metrics.cache_requests.set_total(stats["memory_hits"], cache=name, result="memory_hit")
+        metrics.cache_requests.set_total(stats["disk_hits"], cache=name, result="disk_hit")
+        metrics.cache_requests.set_total(stats["misses"], cache=name, result="miss")
+    stats = fetch_cache.stats()
+    metrics.cache_requests.set_total(stats["hits"], cache="fetch", result="hit")
+    metrics.cache_requests.set_total(stats["misses"], cache="fetch", result="miss")
+    metrics.cache_requests.set_total(stats["revalidated"], cache="fetch", result="not_modified")
+
+    stats = browser_pool.stats()
+    for state in ("in_use", "waiting", "idle_contexts"):
+        metrics.browser_pool_pages.set(stats[state], state=state)
+
+    stats = job_queue.stats()
+    metrics.job_queue_jobs.set(stats["queue_size"], state="queued")
+    metrics.job_queue_jobs.set(stats["running"], state="running")
+
+    stats = clause_index.stats()
+    metrics.clause_index_entries.set(stats["entries"])
+    metrics.cache_requests.set_total(stats["exact_hits"], cache="clause_index", result="exact_hit")
+    metrics.cache_requests.set_total(stats["near_hits"], cache="clause_index", result="near_hit")
+    metrics.cache_requests.set_total(stats["misses"], cache="clause_index", result="miss")
+
+    for backend, state in breaker_states().items():
+        metrics.llm_circuit_open.set(1 if state == OPEN else 0, backend=backend)
+
+
+metrics.registry.register_collector(collect_component_metrics)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Metrics in Prometheus text format."""
+    return PlainTextResponse(
+        metrics.registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
 @app.get("/")
 def read_root():
     return {"status": "Server is running", "message": "Go to /docs to see the API documentation"}
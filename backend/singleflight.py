@@ -0,0 +1,49 @@
+"""
+Deduplication of identical concurrent work ("single flight").
+
+The first caller for a key starts the work, callers arriving while it is in progress
+await the same result instead of repeating the work.
+"""
+
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+import asyncio
+from loguru import logger
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+        self.started = 0
+        self.shared = 0
+
+    async def do(
+        self, key: Hashable, fn: Callable[[], Awaitable[Any]], retry_on_error: bool = False
+    ) -> Any:
+        """
+        Run fn() for key, or join the run which is already in progress.
+        With retry_on_error, a caller which joined a failed run runs its own fn() instead of
+        getting the error, for work which depends on caller data not in the key (API keys).
+        """
+        task = self._in_flight.get(key)
+        joined = task is not None
+        if task is None:
+            self.started += 1
+            task = asyncio.ensure_future(fn())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            self.shared += 1
+            logger.debug(f"Joining in-flight {self.name} work instead of repeating it")
+        try:
+            # one cancelled caller must not cancel the work other callers are waiting for
+            return await asyncio.shield(task)
+        except Exception as e:
+            if not (joined and retry_on_error):
+                raise
+            logger.info(f"Joined {self.name} work failed, running it again: {str(e)}")
+            return await fn()
+
+    def stats(self) -> Dict[str, int]:
+        return {"in_flight": len(self._in_flight), "started": self.started, "shared": self.shared}
@@ -71,7 +71,7 @@ async function handleAnalysis(config, serverUrl, text, url) {
         console.log("Sending request with Key:", config.apiKey ? "Yes" : "No"); // Debug log
         console.log("Target Server:", serverUrl);
 
-        const response = await fetch(`${serverUrl}/analyze`, {
+        const response = await fetch(`${serverUrl}/analyze/stream`, {
             method: "POST",
             headers: {
                 "Content-Type": "application/json"
@@ -88,9 +88,8 @@ async function handleAnalysis(config, serverUrl, text, url) {
             })
         });
 
-        const data = await response.json();
-        
         if (!response.ok) {
+            const data = await response.json();
             // FIX: Check if detail is an object/array and stringify it
             let errorMsg = data.detail;
             if (typeof errorMsg === 'object') {
@@ -99,10 +98,36 @@ async function handleAnalysis(config, serverUrl, text, url) {
             throw new Error(errorMsg || "Server Error");
         }
 
+        // Read server-sent events and send the text received so far to the tab.
+        // Every message carries the whole text, so messages sent before the tab is ready don't matter.
+        let result = "";
+        await readServerSentEvents(response, (event, data) => {
+            if (event === "progress") {
+                chrome.tabs.sendMessage(resultTab.id, {
+                    action: 'displayProgress',
+                    stage: data.stage
+                }).catch(() => {});
+            } else if (event === "token") {
+                result += data.text;
+                chrome.tabs.sendMessage(resultTab.id, {
+                    action: 'displayResult',
+                    data: result,
+                    partial: true,
+                    error: false
+                }).catch(() => {});
+            } else if (event === "error") {
+                let errorMsg = data.detail;
+                if (typeof errorMsg === 'object') {
+                    errorMsg = JSON.stringify(errorMsg);
+                }
+                throw new Error(errorMsg || "Server Error");
+            }
+        });
+
         // Success - Send result to the tab
         chrome.tabs.sendMessage(resultTab.id, { 
             action: 'displayResult', 
-            data: data.result,
+            data: result,
             error: false 
         });
 
@@ -119,3 +144,32 @@ async function handleAnalysis(config, serverUrl, text, url) {
         }
     }
 }
+
+
+async function readServerSentEvents(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let separator;
+        while ((separator = buffer.indexOf("\n\n")) !== -1) {
+            const rawEvent = buffer.slice(0, separator);
+            buffer = buffer.slice(separator + 2);
+            let event = "message";
+            let data = "";
+            for (const line of rawEvent.split("\n")) {
+                if (line.startsWith("event:")) {
+                    event = line.slice(6).trim();
+                } else if (line.startsWith("data:")) {
+                    data += line.slice(5).trim();
+                }
+            }
+            if (data) {
+                onEvent(event, JSON.parse(data));
+            }
+        }
+    }
+}
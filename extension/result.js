@@ -1,5 +1,17 @@
+const STAGE_MESSAGES = {
+    scrape: "Downloading the agreement...",
+    extract: "Extracting text...",
+    compact: "Removing page boilerplate...",
+    llm: "Waiting for the AI analysis..."
+};
+
 chrome.runtime.onMessage.addListener((request, sender, sendResponse) => {
-    if (request.action === 'displayResult') {
+    if (request.action === 'displayProgress') {
+        const statusText = document.getElementById('status');
+        if (statusText && STAGE_MESSAGES[request.stage]) {
+            statusText.textContent = STAGE_MESSAGES[request.stage];
+        }
+    } else if (request.action === 'displayResult') {
         const loadingDiv = document.getElementById('loading');
         const contentDiv = document.getElementById('content');
 